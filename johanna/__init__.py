@@ -1,6 +1,7 @@
 # coding: utf-8
 
 # we do not want IDEs to show lots of unnecessary private Variables
-from .private import main, interactive, apply_schema, Connection, Timer, flag_as_error, collect_stat, ls, get, sleep
+from .private import main, daemon, interactive, apply_schema, Connection, AsyncConnection, Timer, span, flag_as_error, collect_stat, counter, gauge, histogram, ls, get, sleep, \
+    parallel_map, history, snapshot, shard, shards, checkpoint, fetch, fetch_many, changes
 
 
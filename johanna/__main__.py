@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Command line tools for johanna, call as python -m johanna ...
+
+Usage:
+    johanna history [--job=<job>] [--limit=<n>] [--dotfolder=<folder>]
+    johanna -h | --help
+
+Options:
+    --job=<job>           Only runs with this mail subject.
+    --limit=<n>           Number of runs to show [default: 20].
+    --dotfolder=<folder>  johanna's working folder, defaults to $JOHANNA or ~/.johanna
+    -h --help             Show this screen.
+
+Created: 16.10.26
+"""
+
+from docopt import docopt
+
+from .private import history
+
+
+def _history(args) -> None:
+    runs = history(job=args["--job"], limit=int(args["--limit"]), dotfolder=args["--dotfolder"])
+    print(f"{'start':<20} {'job':<24} {'duration':>10} {'cpu':>10} {'peak MB':>10}  result")
+    for run in reversed(runs):
+        result = "ERROR" if run["error"] else "OK"
+        if "REGRESSION" in (run["subject"] or ""):
+            result += " (regression)"
+        peak_mb = "-" if run["peak_mb"] is None else f"{run['peak_mb']:.1f}"
+        print(f"{run['start']:<20} {run['job'][:24]:<24} {run['duration']:>9.1f}s {run['cpu']:>9.1f}s "
+              f"{peak_mb:>10}  {result}")
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    if args["history"]:
+        _history(args)
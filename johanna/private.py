@@ -7,21 +7,37 @@ let's see whether we get the internals hidden away from the johanna module inter
 Created: 29.08.20
 """
 
+# Keep this list short: every import here is paid by each cron job and each
+# notebook restart. Heavy modules are imported where they are needed.
 import os
 import sys
 from pathlib import Path
-import configparser
 import logging
-from logging.handlers import RotatingFileHandler
+import signal
+import io
+import re
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 from time import perf_counter, process_time, sleep as sleep_
-import tracemalloc
 import sqlite3
-from typing import Union
+import threading
+import atexit
+from typing import Union, Iterable, Sequence, Mapping, NamedTuple
 import json
-from collections import defaultdict
-
-import requests
-from docopt import docopt, DocoptExit, DocoptLanguageError
+import math
+import functools
+from collections import defaultdict, deque
+from contextlib import ExitStack, closing
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from bisect import bisect_right
+import zlib
 
 _HOME = None
 
@@ -42,16 +58,15 @@ def _safe(path: Union[Path, str]) -> str:
 
 _DOTFOLDER: Path = None
 _INIFILE: Path = None
-_CONFIG: configparser.ConfigParser = None
+_CONFIG: "configparser.ConfigParser" = None
 _DBFOLDER: Path = None
 _DBNAME: str = None
 _DBPATH: Path = None
 
-def _initialize(dotfolder: Path = None, dbname: str = None, is_interactive: bool = False):
-    global _DOTFOLDER, _INIFILE, _CONFIG, _DBFOLDER, _DBNAME, _DBPATH
-    # DONE accept ~/.folder notation to avoid import os in notebooks
-
-    # ensure dotfolder
+def _resolve_dotfolder(dotfolder: Union[Path, str] = None) -> Path:
+    """
+    :return: dotfolder as given, or from $JOHANNA, or ~/.johanna
+    """
     if not dotfolder:
         if "JOHANNA" in os.environ:
             dotfolder = Path(os.environ["JOHANNA"])
@@ -61,29 +76,42 @@ def _initialize(dotfolder: Path = None, dbname: str = None, is_interactive: bool
         dotfolder = Path(os.environ["HOME"]) / dotfolder[2:]
     if not isinstance(dotfolder, Path):
         dotfolder = Path(dotfolder)
-    if not dotfolder.exists():
-        dotfolder.mkdir()
+    return dotfolder
+
+
+def _initialize(dotfolder: Path = None, dbname: str = None, is_interactive: bool = False,
+                readonly: bool = None):
+    global _DOTFOLDER, _INIFILE, _CONFIG, _DBFOLDER, _DBNAME, _DBPATH, _READONLY
+    # DONE accept ~/.folder notation to avoid import os in notebooks
+
+    # ensure dotfolder
+    dotfolder = _resolve_dotfolder(dotfolder)
+    dotfolder.mkdir(exist_ok=True)
     _DOTFOLDER = dotfolder
     # Application will not have to care about filename
     _INIFILE = dotfolder / "johanna.ini"
 
+    # read configuration first, it may say how to log
+    import configparser
+    _CONFIG = configparser.ConfigParser()
+    ini_exists = bool(_CONFIG.read(_INIFILE))  # no extra stat()
+    queued = _flag("logging", "queue")
+
     # get as most messages in log as possible
     # TODO make logging configurable via .ini
     if is_interactive:
         # good for Jupyter Notebooks etc.
-        _init_logging(collective=False, console=True, process=False)
+        _init_logging(collective=False, console=True, process=False, queued=queued)
     else:
         # good for background jobs
-        _init_logging(collective=True, console=True, process=True)
+        _init_logging(collective=True, console=True, process=True, queued=queued)
 
     # create init-file in dotfolder
-    _CONFIG = configparser.ConfigParser()
-    if _INIFILE.exists():
+    if ini_exists:
         logging.info(f"Configuration file: {_safe(_INIFILE)} OK")
     else:
         logging.info(f"Configuration file: {_safe(_INIFILE)} will be created")
         _INIFILE.touch()
-    _CONFIG.read(_INIFILE)
 
     # create database folder.
     # You can
@@ -103,16 +131,24 @@ def _initialize(dotfolder: Path = None, dbname: str = None, is_interactive: bool
         with open(_INIFILE, "w") as fp:
             _CONFIG.write(fp)
     logging.info(f"Databases go to {_safe(_DBFOLDER)}")
-    if _DBFOLDER.exists():
+    if _DBFOLDER == _DOTFOLDER:
         logging.info("Using existing folder")
     else:
-        logging.info(f"Creating {_safe(_DBFOLDER)}...")
-        _DBFOLDER.mkdir()
+        try:
+            _DBFOLDER.mkdir()
+            logging.info(f"Created {_safe(_DBFOLDER)}")
+        except FileExistsError:
+            logging.info("Using existing folder")
 
     # database will be implicitly created by apply_schema called from application
     _DBNAME = dbname if dbname else "johanna.sqlite"
     _DBPATH = _DBFOLDER / _DBNAME
 
+    # interactive consumers must not get in the way of the background jobs
+    _READONLY = is_interactive if readonly is None else readonly
+    if _READONLY:
+        logging.info("Connections are read-only")
+
     logging.info("Johanna at your service.")
 
 
@@ -149,9 +185,76 @@ _ROTATING_FILE_HANDLER = None
 _STDOUT_HANDLER = None
 _FILE_PATH = None
 _FILE_HANDLER = None
+_LOG_QUEUE = None
+_LOG_LISTENER = None
+
+
+_SHARED_ROTATING_FILE_HANDLER = None
+
 
+def _shared_rotating_file_handler_class() -> type:
+    """
+    The class is created on first use to keep logging.handlers out of "import johanna".
+    """
+    global _SHARED_ROTATING_FILE_HANDLER
+    if _SHARED_ROTATING_FILE_HANDLER:
+        return _SHARED_ROTATING_FILE_HANDLER
+    from logging.handlers import RotatingFileHandler
 
-def _init_logging(collective: bool = False, console: bool = False, process: bool = False) -> None:
+    class _SharedRotatingFileHandler(RotatingFileHandler):
+        """
+        RotatingFileHandler for a file shared by several johanna processes:
+        writing and rotating happen under an exclusive lock on <file>.lock, and
+        the file is reopened when another process has rotated it meanwhile.
+        """
+        def __init__(self, filename, **kwargs):
+            super().__init__(filename, **kwargs)
+            self._lockfile = open(f"{filename}.lock", "a")
+
+        def emit(self, record):
+            fcntl.flock(self._lockfile, fcntl.LOCK_EX)
+            try:
+                self._reopen_if_rotated()
+                super().emit(record)
+            finally:
+                fcntl.flock(self._lockfile, fcntl.LOCK_UN)
+
+        def _reopen_if_rotated(self):
+            if not self.stream:
+                return
+            try:
+                rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+            except FileNotFoundError:
+                rotated = True
+            if rotated:
+                self.stream.close()
+                self.stream = self._open()
+
+        def close(self):
+            super().close()
+            self._lockfile.close()
+
+    _SHARED_ROTATING_FILE_HANDLER = _SharedRotatingFileHandler
+    return _SHARED_ROTATING_FILE_HANDLER
+
+
+def _rotating_file_handler(path: Path, **kwargs) -> logging.Handler:
+    """
+    Pick the best available handler for a log file that other processes rotate, too.
+    """
+    try:
+        from concurrent_log_handler import ConcurrentRotatingFileHandler
+        return ConcurrentRotatingFileHandler(str(path), **kwargs)
+    except ImportError:
+        pass
+    if fcntl:
+        return _shared_rotating_file_handler_class()(path, **kwargs)
+    from logging.handlers import RotatingFileHandler
+    return RotatingFileHandler(path, **kwargs)
+
+
+def _init_logging(collective: bool = False, console: bool = False, process: bool = False,
+                  queued: bool = False) -> None:
     """
     Logs shall be initialized as one of the first steps in bootstrapping.
     While all options default to False, at least one must be true. If none is supplied,
@@ -160,6 +263,8 @@ def _init_logging(collective: bool = False, console: bool = False, process: bool
     :param collective: write to a set of rotating logfiles in ~/.luechenbresse
     :param console: write to console (stdout)
     :param process: write to a logfile unique to this process
+    :param queued: logging calls only put the record into a queue, and a background
+        thread does the writing. Use _flush_logging() before reading the log files.
     :return: nothing. However, a first log message is emitted.
     """
     # DONE run this on import? -> no, decision whether cron or interactive is up to the caller
@@ -167,6 +272,7 @@ def _init_logging(collective: bool = False, console: bool = False, process: bool
     # TODO hide username from logs
 
     global _ROTATING_FILE_PATH, _ROTATING_FILE_HANDLER, _STDOUT_HANDLER, _FILE_PATH, _FILE_HANDLER
+    global _LOG_QUEUE, _LOG_LISTENER
 
     # avoid blunt abuse
     if _ROTATING_FILE_PATH or _STDOUT_HANDLER or _FILE_HANDLER:
@@ -182,9 +288,9 @@ def _init_logging(collective: bool = False, console: bool = False, process: bool
     if collective:
         # default.log with 10 rotating segments of 100k each -> 1 MB (reicht viele Tage)
         _ROTATING_FILE_PATH = _DOTFOLDER / "default.log"
-        # TODO use https://pypi.org/project/concurrent-log-handler/ instead of RotatingFileHandler
+        # DONE use https://pypi.org/project/concurrent-log-handler/ instead of RotatingFileHandler
         # DONE Segmente vergrößern. DWD Tagesload macht 665k Log :)
-        _ROTATING_FILE_HANDLER = RotatingFileHandler(_ROTATING_FILE_PATH, maxBytes=1_000_000, backupCount=10)
+        _ROTATING_FILE_HANDLER = _rotating_file_handler(_ROTATING_FILE_PATH, maxBytes=1_000_000, backupCount=10)
         _ROTATING_FILE_HANDLER.setLevel(logging.INFO)
         handlers.append(_ROTATING_FILE_HANDLER)
         remark.append("collective")
@@ -204,17 +310,84 @@ def _init_logging(collective: bool = False, console: bool = False, process: bool
         handlers.append(_FILE_HANDLER)
         remark.append("process")
 
+    if queued:
+        # the QueueHandler formats the records, the handlers behind the queue just write them
+        import queue
+        from logging.handlers import QueueHandler, QueueListener
+        _LOG_QUEUE = queue.SimpleQueue()
+        _LOG_LISTENER = QueueListener(_LOG_QUEUE, *handlers, respect_handler_level=True)
+        _LOG_LISTENER.start()
+        atexit.register(_flush_logging)
+        handlers = [QueueHandler(_LOG_QUEUE)]
+        remark.append("queued")
+
     # noinspection PyArgumentList
     logging.basicConfig(level=logging.INFO, handlers=handlers, format=_LOGGING_FMT)
     logging.info(f"LogManager lebt. ({','.join(remark)})")
 
 
-def _tail(fnam: Path, circa: int = 1500) -> str:
+def _flush_logging(restart: bool = False) -> None:
+    """
+    In queued mode, wait until all records are written.
+
+    :param restart: keep the background thread running afterwards
+    """
+    global _LOG_LISTENER
+    if not _LOG_LISTENER:
+        return
+    from logging.handlers import QueueListener
+    listener = _LOG_LISTENER
+    _LOG_LISTENER = None
+    listener.stop()  # processes the queue up to here
+    if restart:
+        _LOG_LISTENER = QueueListener(_LOG_QUEUE, *listener.handlers, respect_handler_level=True)
+        _LOG_LISTENER.start()
+
+
+def _detach_file_handler() -> None:
+    """
+    Stop logging to current.log and make sure everything is in there.
+    """
+    global _FILE_HANDLER, _LOG_LISTENER
+    if _LOG_LISTENER:
+        from logging.handlers import QueueListener
+        handlers = [h for h in _LOG_LISTENER.handlers if h is not _FILE_HANDLER]
+        _flush_logging()
+        _LOG_LISTENER = QueueListener(_LOG_QUEUE, *handlers, respect_handler_level=True)
+        _LOG_LISTENER.start()
+    else:
+        logging.getLogger().removeHandler(_FILE_HANDLER)
+    _FILE_HANDLER.close()
+    _FILE_HANDLER = None
+
+
+def _attach_file_handler() -> None:
+    """
+    Start a fresh current.log, for the next job run of daemon().
+    """
+    global _FILE_PATH, _FILE_HANDLER, _LOG_LISTENER
+    _FILE_PATH = _DOTFOLDER / "current.log"
+    _FILE_HANDLER = logging.FileHandler(_FILE_PATH, mode="w")
+    _FILE_HANDLER.setLevel(logging.DEBUG)
+    if _LOG_LISTENER:
+        # records come formatted from the QueueHandler
+        from logging.handlers import QueueListener
+        handlers = list(_LOG_LISTENER.handlers) + [_FILE_HANDLER]
+        _flush_logging()
+        _LOG_LISTENER = QueueListener(_LOG_QUEUE, *handlers, respect_handler_level=True)
+        _LOG_LISTENER.start()
+    else:
+        _FILE_HANDLER.setFormatter(logging.Formatter(_LOGGING_FMT))
+        logging.getLogger().addHandler(_FILE_HANDLER)
+
+
+def _tail(fnam: Path, circa: int = 1500, lines: int = None) -> str:
     """
     Quickly get the last few lines of a possibly big log file.
 
     :param fnam: Path or str to the file
     :param circa: Specify approx. size of tail (from end of file)
+    :param lines: get exactly that many lines instead (circa is ignored then)
     :return: last few lines of the file
     """
     # https://www.roytuts.com/read-last-n-lines-from-file-using-python/
@@ -223,14 +396,80 @@ def _tail(fnam: Path, circa: int = 1500) -> str:
     # https://stackoverflow.com/questions/17615414/how-to-convert-binary-string-to-normal-string-in-python3
     with open(fnam, 'rb') as fh:
         fh.seek(0, os.SEEK_END)
-        offset = min(1500, fh.tell())
-        fh.seek(-offset, os.SEEK_CUR)
-        last_lines = fh.readlines()
-        # first line might be incomplete
-        if len(last_lines) > 1:
-            last_lines = last_lines[1:]
+        pos = fh.tell()
+        if lines is not None:
+            # read backwards block by block until enough line breaks are in
+            data = b""
+            while pos > 0 and data.count(b"\n") <= lines:
+                step = min(8192, pos)
+                pos -= step
+                fh.seek(pos)
+                data = fh.read(step) + data
+            last_lines = data.splitlines(keepends=True)
+            cut = pos > 0 or len(last_lines) > lines
+            last_lines = last_lines[-lines:] if lines > 0 else []
+        else:
+            offset = min(circa, pos)
+            fh.seek(-offset, os.SEEK_CUR)
+            last_lines = fh.readlines()
+            cut = offset < pos
+            # first line might be incomplete, unless we read the whole file
+            if cut and len(last_lines) > 1:
+                last_lines = last_lines[1:]
+            elif cut and last_lines:
+                # no line break at all, at least do not start within an UTF-8 character
+                last_lines[0] = last_lines[0].lstrip(bytes(range(0x80, 0xC0)))
         # decode list of b-strings into str with LFs
-        return "...\n" + "".join([ l.decode() for l in last_lines ])
+        return ("...\n" if cut else "") + b"".join(last_lines).decode(errors="replace")
+
+
+def _excerpt(fnam: Path, head: int = 100, tail: int = 200) -> str:
+    """
+    First and last lines of a possibly big log file, read in one pass with
+    bounded memory.
+
+    :param fnam: Path or str to the file
+    :param head: number of lines from the beginning
+    :param tail: number of lines from the end
+    :return: the lines, with a note how many lines were left out in between
+    """
+    head_lines = []
+    tail_lines = deque(maxlen=tail)
+    total = 0
+    with open(fnam, 'rb') as fh:
+        for line in fh:
+            total += 1
+            if len(head_lines) < head:
+                head_lines.append(line)
+            else:
+                tail_lines.append(line)
+    omitted = total - len(head_lines) - len(tail_lines)
+    gap = [f"...\n[{omitted} lines omitted]\n...\n".encode()] if omitted else []
+    return b"".join(head_lines + gap + list(tail_lines)).decode(errors="replace")
+
+
+def _cap(text: str, limit: int) -> str:
+    """
+    Shorten text to about limit characters by cutting out the middle.
+    """
+    if limit <= 0 or len(text) <= limit:
+        return text
+    half = limit // 2
+    return text[:half] + f"\n...\n[{len(text) - 2 * half} characters omitted]\n...\n" + text[-half:]
+
+
+def _gzip(fnam: Path) -> Path:
+    """
+    Compress a file next to the original, streaming from disk to disk.
+
+    :return: Path of <fnam>.gz
+    """
+    import gzip
+    import shutil
+    target = fnam.with_name(fnam.name + ".gz")
+    with open(fnam, "rb") as src, gzip.open(target, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    return target
 
 
 def flag_as_error() -> None:
@@ -244,66 +483,248 @@ def flag_as_error() -> None:
     logging.error("going to ERROR state")
 
 
-def _shoot_mail(subject="from Johanna with love"):
-    global _FILE_HANDLER
+def _mail_subject(subject: str) -> str:
+    return ( "ERROR - " if ERROR else "SUCCESS - " ) + subject
+
 
+def _shoot_mail(subject="from Johanna with love", appendix: str = ""):
     # close current.log
     # https://stackoverflow.com/questions/15435652/python-does-not-release-filehandles-to-logfile
     if not _FILE_HANDLER:
         raise Exception("Cannot send mail without content in process logger.")
 
-    logger = logging.getLogger()
-    logger.removeHandler(_FILE_HANDLER)
-    _FILE_HANDLER = None
+    _detach_file_handler()
     logging.info(f'closed {_safe(_FILE_PATH)}')
 
     # send file contents via email
     # DONE bei SUCCESS nur eine kleine Statistik senden, nur bei ERROR das ganze Log
+    # DONE bei ERROR nur Anfang und Ende in den Text, das ganze Log als .gz anhängen
     if ERROR:
-        # https://realpython.com/python-pathlib/#reading-and-writing-files
-        body = _FILE_PATH.read_text()
+        body = _excerpt(_FILE_PATH, head=int(get("mail", "head-lines", 100)),
+                        tail=int(get("mail", "tail-lines", 200)))
     else:
-        body = _tail(_FILE_PATH)
+        tail_lines = get("mail", "success-lines")
+        if tail_lines:
+            body = _tail(_FILE_PATH, lines=int(tail_lines))
+        else:
+            body = _tail(_FILE_PATH, circa=int(get("mail", "success-bytes", 1500)))
+    if appendix:
+        body += "\n\n" + appendix
+    body = _cap(body, int(get("mail", "max-body", 100_000)))
+
+    attach = get("mail", "attach", "error")
+    attachments = []
+    if attach == "always" or (attach == "error" and ERROR):
+        gz = _gzip(_FILE_PATH)
+        # too big, mailgun would refuse the whole mail (and the notification was lost)
+        limit = int(get("mail", "max-attachment", 10_000_000))
+        size = gz.stat().st_size
+        if size <= limit:
+            attachments.append(gz)
+        else:
+            body += (f"\n\n[{gz.name} not attached: {size:,} bytes, more than max-attachment = {limit:,}. "
+                     f"It is in {_safe(gz)} until the next run.]")
 
     # TODO not throw away but append after reading the contents
     # logger.addHandler(_FILE_HANDLER)
 
-    subject = ( "ERROR - " if ERROR else "SUCCESS - " ) + subject
-    mailgun(subject, body)
+    mailgun(_mail_subject(subject), body, attachments)
 
 
-def mailgun(subject: str, body: str) -> None:
+def mailgun(subject: str, body: str, attachments: list = None) -> None:
     """
     Send mail via the mailgun account configured in the [mailgun] section of
     <dotfolder>/johanna.ini
+    If mailgun cannot be reached, the mail goes to <dotfolder>/outbox and is
+    sent by the next run.
 
     :param subject: The Subject for the mail.
     :param body: The body of the mail.
+    :param attachments: Paths of files to attach. They are read from disk when sending,
+        each one completely into memory (requests builds the multipart body there).
     :return:
     """
-    url = get("mailgun", "url")
-    auth_key = get("mailgun", "auth-key")
-    from_ = get("mailgun", "from")
-    to = get("mailgun", "to")
-    active = url and auth_key and from_ and to
-
-    if not active:
+    if not _mailgun_active():
         logging.info(f"no mailgun account configured (subject={subject})")
     else:
         logging.info(f"sending mail: {subject}")
-        try:
-            r = requests.post(
-                url,
-                auth=("api", auth_key),
+        if _send_mail(subject, body, attachments) == "retry":
+            _spool_mail(subject, body, attachments)
+
+
+def _mailgun_active() -> bool:
+    return bool(get("mailgun", "url") and get("mailgun", "auth-key")
+                and get("mailgun", "from") and get("mailgun", "to"))
+
+
+_SESSION = None
+
+
+def _session() -> "requests.Session":
+    """
+    One pooled HTTP session per process for all notifications.
+    """
+    global _SESSION
+    if not _SESSION:
+        import requests  # takes long, and many runs never send a mail
+        _SESSION = requests.Session()
+    return _SESSION
+
+
+def _send_mail(subject: str, body: str, attachments: list = None, session: "requests.Session" = None) -> str:
+    """
+    Post a mail to mailgun, with connect and read timeouts from [mailgun]
+    (connect-timeout, read-timeout in seconds).
+
+    :param session: defaults to the session of the process
+    :return: "sent", "rejected" (mailgun refused it, e.g. 400 or 401, waiting will
+        not help), or "retry" (not reachable, server trouble or rate limit)
+    """
+    timeout = (float(get("mailgun", "connect-timeout", 5)), float(get("mailgun", "read-timeout", 30)))
+    t0 = perf_counter()
+    try:
+        with ExitStack() as stack:
+            files = [("attachment", (Path(a).name, stack.enter_context(open(a, "rb"))))
+                     for a in attachments or []]
+            r = (session or _session()).post(
+                get("mailgun", "url"),
+                auth=("api", get("mailgun", "auth-key")),
                 data={
-                    "from": from_,
-                    "to": to,
+                    "from": get("mailgun", "from"),
+                    "to": get("mailgun", "to"),
                     "subject": subject,
                     "text": body
-                })
-            logging.info(f"mailgun: HTTP {r.status_code}")
-        except Exception as ex:
-            logging.exception(f"mailgun")
+                },
+                files=files or None,
+                timeout=timeout)
+        logging.info(f"mailgun: HTTP {r.status_code} ({perf_counter() - t0:.3f} s)")
+        if 200 <= r.status_code < 300:
+            outcome = "sent"
+        elif r.status_code >= 500 or r.status_code == 429:
+            outcome = "retry"
+        else:
+            outcome = "rejected"
+            logging.error(f"mailgun rejected the mail: HTTP {r.status_code} {r.text[:200]}")
+    except Exception as ex:
+        logging.exception(f"mailgun")
+        outcome = "retry"
+    _count("mail_sec", perf_counter() - t0)
+    _count("mail_sent" if outcome == "sent" else "mail_failed")
+    return outcome
+
+
+def _outbox() -> Path:
+    return _DOTFOLDER / "outbox"
+
+
+def _spool_mail(subject: str, body: str, attachments: list = None) -> None:
+    """
+    Keep an unsent mail in <dotfolder>/outbox/<timestamp>/, together with copies
+    of the attachments.
+    """
+    import shutil
+    folder = _outbox() / f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+    folder.mkdir(parents=True, exist_ok=True)
+    names = []
+    for a in attachments or []:
+        shutil.copyfile(a, folder / Path(a).name)
+        names.append(Path(a).name)
+    message = {"subject": subject, "body": body, "attachments": names}
+    (folder / "message.json").write_text(json.dumps(message))
+    _count("mail_spooled")
+    logging.warning(f"mail spooled to {_safe(folder)}")
+
+
+def _claim(folder: Path) -> Union[Path, None]:
+    """
+    Take a spooled mail for sending by renaming its folder to <name>.claimed-<pid>.
+    Only one process wins the rename. The claim of a process that died meanwhile
+    can be taken over (the mail may then arrive twice, but is not lost).
+
+    :return: the claimed folder, or None if somebody else has it
+    """
+    name, _, owner = folder.name.partition(".claimed-")
+    if owner:
+        try:
+            os.kill(int(owner), 0)
+            return None  # still being sent
+        except ProcessLookupError:
+            pass
+        except (ValueError, PermissionError):
+            return None
+    claimed = folder.with_name(f"{name}.claimed-{os.getpid()}")
+    try:
+        folder.rename(claimed)
+    except OSError:
+        return None
+    return claimed
+
+
+def _flush_outbox() -> None:
+    """
+    Send the mails that earlier runs could not deliver, oldest first.
+    Uses a session of its own, as it runs beside the main thread.
+    """
+    if not _outbox().exists() or not _mailgun_active():
+        return
+    import shutil
+    import requests
+    with requests.Session() as session:
+        for folder in sorted(_outbox().iterdir()):
+            if _OUTBOX_STOP.is_set():
+                break
+            if folder.name.endswith(".rejected") or not (folder / "message.json").exists():
+                continue
+            folder = _claim(folder)
+            if not folder:
+                continue
+            message = json.loads((folder / "message.json").read_text())
+            logging.info(f"sending spooled mail {folder.name}: {message['subject']}")
+            attachments = [folder / name for name in message["attachments"]]
+            outcome = _send_mail(message["subject"], message["body"], attachments, session)
+            if outcome == "sent":
+                shutil.rmtree(folder)
+            elif outcome == "rejected":
+                # keep it for inspection, but do not send it again
+                folder.rename(folder.with_name(folder.name.split(".claimed-")[0] + ".rejected"))
+            else:
+                folder.rename(folder.with_name(folder.name.split(".claimed-")[0]))
+                break  # still not reachable, try again next run
+
+
+_OUTBOX_THREAD = None
+_OUTBOX_STOP = threading.Event()
+# how long the end of main() waits for the outbox flush
+_OUTBOX_WAIT_SEC = 2.0
+
+
+def _start_outbox_flush() -> None:
+    """
+    Flush the outbox in the background, unless a flush is still running.
+    Call _finish_outbox_flush() before the process ends.
+    """
+    global _OUTBOX_THREAD
+    if _OUTBOX_THREAD and _OUTBOX_THREAD.is_alive():
+        return
+    if _outbox().exists():
+        _OUTBOX_THREAD = threading.Thread(target=_flush_outbox, name="johanna-outbox", daemon=True)
+        _OUTBOX_THREAD.start()
+
+
+def _finish_outbox_flush() -> None:
+    """
+    Give the flush a moment to finish, without delaying the end of the process
+    noticeably. A mail that is cut off stays claimed by this process and is
+    taken over by the next run, the others wait for the next run anyway.
+    """
+    global _OUTBOX_THREAD
+    if _OUTBOX_THREAD:
+        _OUTBOX_THREAD.join(_OUTBOX_WAIT_SEC)
+        _OUTBOX_STOP.set()
+        if _OUTBOX_THREAD.is_alive():
+            logging.info("outbox is still being flushed, the next run continues")
+        _OUTBOX_THREAD = None
+        _OUTBOX_STOP.clear()
 
 
 class Timer(object):
@@ -333,6 +754,164 @@ class Timer(object):
             return dt if raw else "[%0.3f s]" % dt
 
 
+class _Sketch:
+    """
+    Bounded-memory distribution of values: count, total, min, max and
+    approximate quantiles from logarithmic buckets (about 4 % relative error).
+    """
+    _GAMMA = 1.08
+    _LOG_GAMMA = math.log(_GAMMA)
+    _TINY = 1e-12
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._pos = defaultdict(int)
+        self._neg = defaultdict(int)
+        self._zero = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value > self._TINY:
+            self._pos[math.ceil(math.log(value) / self._LOG_GAMMA)] += 1
+        elif value < -self._TINY:
+            self._neg[math.ceil(math.log(-value) / self._LOG_GAMMA)] += 1
+        else:
+            self._zero += 1
+
+    def merge(self, other: "_Sketch") -> None:
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for key, n in other._pos.items():
+            self._pos[key] += n
+        for key, n in other._neg.items():
+            self._neg[key] += n
+        self._zero += other._zero
+
+    def _value(self, key: int) -> float:
+        # middle of the bucket (gamma^(key-1), gamma^key]
+        return 2 * self._GAMMA ** key / (self._GAMMA + 1)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        buckets = [(-self._value(k), n) for k, n in sorted(self._neg.items(), reverse=True)]
+        buckets.append((0.0, self._zero))
+        buckets += [(self._value(k), n) for k, n in sorted(self._pos.items())]
+        for value, n in buckets:
+            seen += n
+            if seen > rank:
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+
+
+# span path -> [_Sketch, time spent in child spans]
+_SPANS = {}
+_SPANS_LOCK = threading.Lock()
+_SPAN_STACK = threading.local()
+
+
+class _Span(Timer):
+    """
+    A named Timer that nests: a span opened within another span is recorded
+    under "outer/inner". Durations are aggregated per path for the report at
+    the end of main(). Use span() to create one.
+    """
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+        self.path = None
+        self.children = 0.0
+
+    def __enter__(self):
+        stack = getattr(_SPAN_STACK, "stack", None)
+        if stack is None:
+            stack = _SPAN_STACK.stack = []
+        self.path = f"{stack[-1].path}/{self.name}" if stack else self.name
+        stack.append(self)
+        return super().__enter__()
+
+    def __exit__(self, type, value, traceback):
+        super().__exit__(type, value, traceback)
+        stack = _SPAN_STACK.stack
+        stack.pop()
+        if stack:
+            stack[-1].children += self.elapsed
+        with _SPANS_LOCK:
+            entry = _SPANS.get(self.path)
+            if entry is None:
+                entry = _SPANS[self.path] = [_Sketch(), 0.0]
+            entry[0].add(self.elapsed)
+            entry[1] += self.children
+
+    def __call__(self, func):
+        # used as a decorator: a fresh span for every call
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Span(self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def span(name: str) -> _Span:
+    """
+    Named, nestable stopwatch that aggregates count, total, min, max and
+    approximate p50/p95/p99 per span path. The span tree is reported at the
+    end of main(), sorted by self time (time not spent in child spans).
+    use like so:
+        with johanna.span("parse"):
+            for row in rows:
+                with johanna.span("station"):  # recorded as parse/station
+                    ...
+    or as a decorator:
+        @johanna.span("parse.station")
+        def parse_station(row):
+            ...
+
+    :param name: name of the span, must not contain "/"
+    """
+    if "/" in name:
+        raise ValueError(f"span name '{name}' must not contain '/'")
+    return _Span(name)
+
+
+def _span_report() -> str:
+    """
+    :return: span tree as a table, siblings sorted by self time
+    """
+    with _SPANS_LOCK:
+        rows = {path: (sketch, sketch.total - children) for path, (sketch, children) in _SPANS.items()}
+    lines = [f"{'span':<40} {'count':>8} {'total':>9} {'self':>9} {'min':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"]
+
+    def add(parent: str, depth: int) -> None:
+        children = [path for path in rows if path.rpartition("/")[0] == parent]
+        for path in sorted(children, key=lambda p: rows[p][1], reverse=True):
+            sketch, self_time = rows[path]
+            label = "  " * depth + path.rpartition("/")[2]
+            lines.append(f"{label:<40} {sketch.count:>8} {sketch.total:>8.3f}s {self_time:>8.3f}s "
+                         f"{sketch.min:>8.4f}s {sketch.quantile(0.5):>8.4f}s {sketch.quantile(0.95):>8.4f}s "
+                         f"{sketch.quantile(0.99):>8.4f}s {sketch.max:>8.4f}s")
+            add(path, depth + 1)
+
+    add("", 0)
+    return "\n".join(lines)
+
+
 def sleep(seconds: float = 1.0) -> None:
     if seconds <= 0.0:
         seconds = 1.0
@@ -342,19 +921,182 @@ def sleep(seconds: float = 1.0) -> None:
     sleep_(seconds)
 
 
-def ls(path: Path) -> None:
+class Entry(NamedTuple):
+    path: str  # relative to the listed folder
+    size: int
+    mtime: float
+    is_dir: bool
+
+
+def _scan(folder: Path, recursive: bool = False) -> Iterable[tuple]:
+    """
+    Walk a folder with os.scandir(), without following symlinks to folders.
+
+    :return: generator of (path relative to folder, os.DirEntry)
+    """
+    stack = [""]
+    while stack:
+        prefix = stack.pop()
+        with os.scandir(folder / prefix if prefix else folder) as it:
+            for entry in it:
+                rel = f"{prefix}/{entry.name}" if prefix else entry.name
+                yield rel, entry
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    stack.append(rel)
+
+
+def ls(path: Union[Path, str], recursive: bool = False, top: int = 10) -> list:
     """
-    Listet das angegebene Verzeichnis in zeitlicher Sortierung ins log.
-    Cortesy https://linuxhandbook.com/execute-shell-command-python/
+    Listet das angegebene Verzeichnis in zeitlicher Sortierung und schreibt eine
+    kurze Zusammenfassung ins log: Anzahl, Größe, und die top neuesten Einträge.
 
     :param path: das zu listende Verzeichnis
+    :param recursive: auch die Unterverzeichnisse
+    :param top: so viele der neuesten Einträge kommen ins log
+    :return: list of Entry(path, size, mtime, is_dir), oldest first (like ls -latr)
     """
-    console = os.popen(f'cd {path}; ls -latr').read()
-    logging.info(f"ls -la {_safe(path)}:\n" + console)
+    path = Path(path).expanduser()
+    entries = []
+    for rel, entry in _scan(path, recursive):
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:  # gone in the meantime
+            continue
+        entries.append(Entry(rel, st.st_size, st.st_mtime, entry.is_dir(follow_symlinks=False)))
+    entries.sort(key=lambda e: e.mtime)
+    folders = sum(1 for e in entries if e.is_dir)
+    size = sum(e.size for e in entries if not e.is_dir)
+    lines = [f"ls {_safe(path)}: {len(entries) - folders:,} files, {folders:,} folders, {size / 1024 / 1024:,.1f} MB"]
+    if top > 0 and entries:
+        lines.append(f"newest {min(top, len(entries))}:")
+        for e in entries[-top:]:
+            size_text = "<dir>" if e.is_dir else f"{e.size:,}"
+            lines.append(f"  {datetime.fromtimestamp(e.mtime):%Y-%m-%d %H:%M:%S} {size_text:>15}  {e.path}")
+    logging.info("\n".join(lines))
+    return entries
+
+
+class Changes(NamedTuple):
+    new: list      # of Entry
+    changed: list  # of Entry
+    removed: list  # of paths
+
+
+_MANIFEST_TABLE = """
+CREATE TABLE IF NOT EXISTS johanna_manifest (
+    folder TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT,
+    PRIMARY KEY (folder, path)
+) WITHOUT ROWID;
+"""
+
+
+def _file_hash(fnam: Path) -> str:
+    import hashlib
+    h = hashlib.sha256()
+    with open(fnam, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def changes(path: Union[Path, str], c: "Connection" = None, recursive: bool = True, hashed: bool = False) -> Changes:
+    """
+    New, changed and removed files of a folder since the last call, by comparing
+    with a manifest (path, size, mtime, optional hash) kept in SQLite. Only the
+    differences are written back. Give a Connection to keep the manifest in the
+    job's database (table johanna_manifest), updated in the Connection's transaction:
+    then the changes come again if the run fails before c.commit().
+        with Connection("load") as c:
+            for e in changes("~/inbox", c).new:
+                load(c, e.path)
+            c.commit()
+
+    :param path: the folder
+    :param c: Connection for the manifest. Defaults to <dotfolder>/manifest.sqlite,
+        which is committed right away.
+    :param recursive: include subfolders
+    :param hashed: keep a SHA-256 per file, so that files that were only touched
+        (same size, new mtime, same content) do not count as changed. Only new and
+        possibly changed files are hashed.
+    :return: Changes(new, changed, removed), new and changed sorted by mtime
+    """
+    folder = Path(path).expanduser().resolve()
+    t0 = perf_counter()
+    own = c is None
+    if own:
+        conn = sqlite3.connect(_DOTFOLDER / "manifest.sqlite", timeout=10)
+        cur = conn.cursor()
+    else:
+        cur = c._cursor()
+    try:
+        cur.execute(_MANIFEST_TABLE)
+        known = {row[0]: row[1:] for row in cur.execute(
+            "SELECT path, size, mtime_ns, hash FROM johanna_manifest WHERE folder = ?", (str(folder),))}
+        new, changed, upserts, touched = [], [], [], []
+        total = 0
+        for rel, entry in _scan(folder, recursive):
+            if entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            total += 1
+            old = known.pop(rel, None)
+            if old and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+                continue
+            digest = _file_hash(folder / rel) if hashed else None
+            if old and hashed and old[0] == st.st_size and old[2] == digest:
+                touched.append((st.st_mtime_ns, str(folder), rel))
+                continue
+            (changed if old else new).append(Entry(rel, st.st_size, st.st_mtime, False))
+            upserts.append((str(folder), rel, st.st_size, st.st_mtime_ns, digest))
+        removed = sorted(known)
+        if upserts:
+            cur.executemany("INSERT OR REPLACE INTO johanna_manifest (folder, path, size, mtime_ns, hash) "
+                            "VALUES (?, ?, ?, ?, ?)", upserts)
+        if touched:
+            cur.executemany("UPDATE johanna_manifest SET mtime_ns = ? WHERE folder = ? AND path = ?", touched)
+        if removed:
+            cur.executemany("DELETE FROM johanna_manifest WHERE folder = ? AND path = ?",
+                            [(str(folder), rel) for rel in removed])
+        if own:
+            conn.commit()
+    finally:
+        cur.close()
+        if own:
+            conn.close()
+    new.sort(key=lambda e: e.mtime)
+    changed.sort(key=lambda e: e.mtime)
+    logging.info(f"changes in {_safe(folder)}: {len(new):,} new, {len(changed):,} changed, {len(removed):,} removed "
+                 f"of {total:,} files ({perf_counter() - t0:.3f} s)")
+    return Changes(new, changed, removed)
 
 
 # johanna will modify this directly only
+# counters; collect_stat() and counter() add to them
 GLOBAL_STAT = defaultdict(int)
+_RESERVED_STATS = ["connection_sec", "pool_hit", "pool_miss", "bulk_rows", "bulk_batches", "bulk_sec",
+                   "lock_retries", "lock_wait_sec", "mail_sec", "mail_sent", "mail_failed", "mail_spooled",
+                   "fetch_bytes", "fetch_downloads", "fetch_hits", "fetch_failed", "fetch_sec"]
+# name -> [last, min, max]
+_GAUGES = {}
+# name -> _Sketch
+_HISTOGRAMS = {}
+_METRICS_LOCK = threading.Lock()
+
+
+def _count(collector: str, value_to_add: Union[int, float] = 1) -> None:
+    """
+    Thread-safe update of a counter, also for johanna internal ones.
+    """
+    with _METRICS_LOCK:
+        GLOBAL_STAT[collector] += value_to_add
+
 
 def collect_stat(collector: str, value_to_add: Union[int, float]) -> None:
     """
@@ -362,10 +1104,594 @@ def collect_stat(collector: str, value_to_add: Union[int, float]) -> None:
     :param collector: Name of the collector
     :param value_to_add: Value to aggregate into the statistics, int or flaot
     """
-    # TODO add memory and runtime info here?
-    if collector in [ "connection_sec", ]:
+    # DONE add memory and runtime info here? -> gauge() and histogram()
+    if collector in _RESERVED_STATS:
         raise ValueError(f"collector='{collector}' is reserved for johanna internal use")
-    GLOBAL_STAT[collector] += value_to_add
+    _count(collector, value_to_add)
+
+
+def counter(name: str, value: Union[int, float] = 1) -> None:
+    """
+    Add to a counter, i.e. a sum over the run (same as collect_stat()).
+
+    :param name: Name of the counter
+    :param value: Value to add, defaults to 1
+    """
+    collect_stat(name, value)
+
+
+def gauge(name: str, value: Union[int, float]) -> None:
+    """
+    Set a gauge, i.e. a level like a queue length or a file size. The report
+    shows the last, minimum and maximum value.
+
+    :param name: Name of the gauge
+    :param value: Current value
+    """
+    with _METRICS_LOCK:
+        g = _GAUGES.get(name)
+        if g is None:
+            _GAUGES[name] = [value, value, value]
+        else:
+            g[0] = value
+            if value < g[1]:
+                g[1] = value
+            if value > g[2]:
+                g[2] = value
+
+
+def histogram(name: str, value: Union[int, float]) -> None:
+    """
+    Record a value in a histogram, e.g. a latency or a row size. The report
+    shows count, mean, min, max and approximate p50/p95/p99. Memory does not
+    grow with the number of values.
+
+    :param name: Name of the histogram
+    :param value: Value to record
+    """
+    with _METRICS_LOCK:
+        h = _HISTOGRAMS.get(name)
+        if h is None:
+            h = _HISTOGRAMS[name] = _Sketch()
+        h.add(value)
+
+
+def _metrics_snapshot() -> tuple:
+    with _METRICS_LOCK:
+        return dict(GLOBAL_STAT), {k: list(v) for k, v in _GAUGES.items()}, dict(_HISTOGRAMS)
+
+
+def _reset_metrics() -> None:
+    with _METRICS_LOCK:
+        GLOBAL_STAT.clear()
+        _GAUGES.clear()
+        _HISTOGRAMS.clear()
+
+
+def _merge_metrics(snapshot: tuple) -> None:
+    """
+    Add metrics of another process (see _metrics_snapshot()) to the own ones.
+    """
+    counters, gauges, histograms = snapshot
+    with _METRICS_LOCK:
+        for name, value in counters.items():
+            GLOBAL_STAT[name] += value
+        for name, (last, lo, hi) in gauges.items():
+            g = _GAUGES.get(name)
+            if g is None:
+                _GAUGES[name] = [last, lo, hi]
+            else:
+                _GAUGES[name] = [last, min(g[1], lo), max(g[2], hi)]
+        for name, sketch in histograms.items():
+            h = _HISTOGRAMS.get(name)
+            if h is None:
+                h = _HISTOGRAMS[name] = _Sketch()
+            h.merge(sketch)
+
+
+def _fmt(value: Union[int, float]) -> str:
+    if isinstance(value, int):
+        return f"{value:,}"
+    return f"{value:,.3f}"
+
+
+def _stat_report() -> str:
+    """
+    :return: counters, gauges and histograms as readable tables
+    """
+    counters, gauges, histograms = _metrics_snapshot()
+    lines = []
+    if counters:
+        lines.append(f"{'counter':<40} {'value':>15}")
+        for name in sorted(counters):
+            lines.append(f"{name:<40} {_fmt(counters[name]):>15}")
+    if gauges:
+        lines.append(f"{'gauge':<40} {'last':>15} {'min':>15} {'max':>15}")
+        for name in sorted(gauges):
+            lines.append(f"{name:<40} " + " ".join(f"{_fmt(v):>15}" for v in gauges[name]))
+    if histograms:
+        lines.append(f"{'histogram':<40} {'count':>10} {'mean':>12} {'min':>12} {'p50':>12} "
+                     f"{'p95':>12} {'p99':>12} {'max':>12}")
+        for name in sorted(histograms):
+            h = histograms[name]
+            values = (h.mean, h.min, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99), h.max)
+            lines.append(f"{name:<40} {h.count:>10,} " + " ".join(f"{v:>12.4g}" for v in values))
+    return "\n".join(lines) if lines else "(none)"
+
+
+# PRAGMAs that can be configured in the [databases] section of johanna.ini,
+# either for all databases (journal_mode = WAL) or for a single database file
+# (charlotte.sqlite.journal_mode = WAL). They are applied once per physical connection.
+_PRAGMAS = ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store")
+
+
+def _flag(section: str, key: str, default: bool = False) -> bool:
+    """
+    Read a yes/no switch from johanna.ini. Works before initialization, too.
+    """
+    if not _CONFIG or not _CONFIG.has_section(section):
+        return default
+    return _CONFIG[section].getboolean(key, fallback=default)
+
+
+def _db_option(dbpath: Path, key: str, default: str = None) -> str:
+    """
+    Read a setting for a database file from the [databases] section, where
+    <dbname>.<key> takes precedence over <key>.
+    """
+    if not _CONFIG or not _CONFIG.has_section("databases"):
+        return default
+    section = _CONFIG["databases"]
+    return section.get(f"{dbpath.name}.{key}", section.get(key, default))
+
+
+def _pragmas(dbpath: Path) -> dict:
+    """
+    Collect the configured PRAGMAs for a database file.
+
+    :param dbpath: Path of the database file
+    :return: dict pragma -> value, in the order of _PRAGMAS
+    """
+    pragmas = {}
+    for pragma in _PRAGMAS:
+        value = _db_option(dbpath, pragma)
+        if value:
+            pragmas[pragma] = value
+    return pragmas
+
+
+# defaults for lock handling, can be set in [databases] (globally or per file)
+_BUSY_TIMEOUT_MS = 5000  # same as sqlite3.connect()
+_LOCK_RETRIES = 5
+_LOCK_BACKOFF_SEC = 0.1
+
+
+# interactive() makes Connections read-only by default
+_READONLY = False
+# resolved database path -> (URI of the in-memory copy, connection that keeps it alive)
+_SNAPSHOTS = {}
+_SNAPSHOTS_LOCK = threading.Lock()
+
+
+def _connect(dbpath: Path, readonly: bool = False, pooled: bool = False) -> sqlite3.Connection:
+    """
+    Open a physical connection with the configured busy_timeout and apply the configured PRAGMAs.
+    Goes to the in-memory snapshot of the file if there is one (see snapshot()).
+
+    :param readonly: open with mode=ro and query_only, so the connection can never
+        take a write lock
+    :param pooled: the connection goes to the pool, which closes it from another thread
+    """
+    busy_timeout = int(_db_option(dbpath, "busy_timeout", _BUSY_TIMEOUT_MS))
+    snap = _SNAPSHOTS.get(str(dbpath.resolve())) if _SNAPSHOTS else None
+    options = dict(uri=True, timeout=busy_timeout / 1000.0, check_same_thread=not pooled)
+    if snap:
+        conn = sqlite3.connect(snap[0], **options)
+    elif readonly:
+        conn = sqlite3.connect(f"{dbpath.resolve().as_uri()}?mode=ro", **options)
+    else:
+        # uri=True lets attach() open other files read-only; plain paths are not affected
+        conn = sqlite3.connect(dbpath, **options)
+    for pragma, value in _pragmas(dbpath).items():
+        if pragma == "journal_mode" and (snap or readonly):
+            continue  # belongs to the file, and changing it needs write access
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def snapshot(dbpath: Union[str, Path] = None) -> None:
+    """
+    Copy a database file into memory with SQLite's backup API. From then on,
+    every Connection() to that file in this process works on the private copy
+    at memory speed and never touches (or locks) the file. Call again to
+    refresh the copy.
+
+    :param dbpath: database file, defaults to the one of interactive()/main()
+    """
+    dbpath = Path(dbpath) if dbpath else _DBPATH
+    key = str(dbpath.resolve())
+    t0 = perf_counter()
+    with _SNAPSHOTS_LOCK:
+        if key in _SNAPSHOTS:
+            uri, holder = _SNAPSHOTS[key]
+        else:
+            uri = f"file:johanna-snapshot-{len(_SNAPSHOTS)}-{os.getpid()}?mode=memory&cache=shared"
+            holder = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        source = sqlite3.connect(f"{dbpath.resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            source.backup(holder)
+        finally:
+            source.close()
+        _SNAPSHOTS[key] = (uri, holder)
+    # pooled connections may still point to the file
+    _close_pool()
+    pages = holder.execute("PRAGMA page_count").fetchone()[0] * holder.execute("PRAGMA page_size").fetchone()[0]
+    logging.info(f"Snapshot of {_safe(dbpath.name)} in memory: {pages / 1024 / 1024:.1f} MB "
+                 f"in {perf_counter() - t0:.3f} s")
+
+
+# Named databases and shards, configured in [databases]:
+#   db.archive = archive.sqlite      Connection(dbpath="archive"), Connection(attach=["archive"])
+#   shards.readings = 4              hash shards readings_0.sqlite .. readings_3.sqlite
+#   ranges.readings = 2020, 2024     range shards: key < 2020, key < 2024, the rest
+# Relative file names are relative to the database folder.
+
+def _db_file(name: str) -> Path:
+    path = Path(name)
+    return path if path.is_absolute() else _DBFOLDER / path
+
+
+def _named_database(name: str) -> Union[Path, None]:
+    # works before initialization, too, like _db_option()
+    if not _CONFIG or not _CONFIG.has_section("databases"):
+        return None
+    value = _CONFIG["databases"].get(f"db.{name}")
+    return _db_file(value) if value else None
+
+
+@functools.lru_cache(maxsize=None)
+def _shard_layout(name: str, count: str, ranges: str, dbfolder: Path) -> tuple:
+    """
+    Parse the shard configuration of a table (cached, as shard() is called per row).
+
+    :return: (list of shard files, list of range bounds or None for hash shards)
+    """
+    bounds = None
+    if ranges:
+        bounds = [b.strip() for b in ranges.split(",") if b.strip()]
+        try:
+            bounds = [float(b) for b in bounds]
+        except ValueError:
+            pass
+        n = len(bounds) + 1
+    else:
+        n = int(count or 0)
+    if n < 1:
+        raise ValueError(f"no shards.{name} or ranges.{name} in [databases] of johanna.ini")
+    return [dbfolder / f"{name}_{i}.sqlite" for i in range(n)], bounds
+
+
+def shards(name: str) -> list:
+    """
+    :param name: sharded table, as configured with shards.<name> or ranges.<name> in [databases]
+    :return: paths of all shard files of that table
+    """
+    files, _ = _shard_layout(name, get("databases", f"shards.{name}"), get("databases", f"ranges.{name}"),
+                             _DBFOLDER)
+    return list(files)
+
+
+def shard(name: str, key) -> Path:
+    """
+    Route a key to the shard file of a table, e.g. for writing:
+        with Connection("load", dbpath=shard("readings", station)) as c:
+            ...
+    Hash shards use CRC32 of str(key), so the routing is the same in every
+    process and run. Range shards compare the key with the configured bounds
+    (as number if all bounds are numbers, else as str).
+
+    :return: path of the shard file
+    """
+    files, bounds = _shard_layout(name, get("databases", f"shards.{name}"), get("databases", f"ranges.{name}"),
+                                  _DBFOLDER)
+    if bounds is None:
+        return files[zlib.crc32(str(key).encode("utf-8")) % len(files)]
+    return files[bisect_right(bounds, float(key) if isinstance(bounds[0], float) else str(key))]
+
+
+def _attach(conn: sqlite3.Connection, names: Sequence[str], dbpath: Path) -> tuple:
+    """
+    Attach named databases and all shards of sharded tables read-only. A sharded
+    table gets a temporary view <table>_all over all its shards (UNION ALL), so
+    that the table itself stays writable when the connection is to one of the
+    shards. That shard is not attached again, the view reads it from main.
+    Mind SQLite's limit of 10 attached databases per connection.
+
+    :param dbpath: the database file of the connection
+    :return: (attached schema names, created temporary views), to undo it later
+    """
+    schemas = []
+    views = []
+    own = dbpath.resolve()
+    for name in names:
+        db = _named_database(name)
+        files = [(name, db)] if db else [(f"{name}_{i}", path) for i, path in enumerate(shards(name))]
+        parts = []
+        for schema, path in files:
+            if path.resolve() == own:
+                if not db and conn.execute("SELECT 1 FROM main.sqlite_master WHERE name = ?", (name,)).fetchone():
+                    parts.append(f'SELECT * FROM main."{name}"')
+                continue
+            if not path.exists():
+                logging.warning(f"attach: {_safe(path.name)} does not exist (yet), skipped")
+                continue
+            snap = _SNAPSHOTS.get(str(path.resolve())) if _SNAPSHOTS else None
+            uri = snap[0] if snap else f"{path.resolve().as_uri()}?mode=ro"
+            conn.execute(f'ATTACH DATABASE ? AS "{schema}"', (uri,))
+            schemas.append(schema)
+            if not db and conn.execute(f'SELECT 1 FROM "{schema}".sqlite_master WHERE name = ?', (name,)).fetchone():
+                parts.append(f'SELECT * FROM "{schema}"."{name}"')
+        if parts:
+            _temp_ddl(conn, f'CREATE TEMP VIEW "{name}_all" AS ' + " UNION ALL ".join(parts))
+            views.append(f"{name}_all")
+    return schemas, views
+
+
+def _temp_ddl(conn: sqlite3.Connection, sql: str) -> None:
+    # query_only of read-only connections also blocks the temp schema
+    query_only = conn.execute("PRAGMA query_only").fetchone()[0]
+    if query_only:
+        conn.execute("PRAGMA query_only = OFF")
+    try:
+        conn.execute(sql)
+    finally:
+        if query_only:
+            conn.execute("PRAGMA query_only = ON")
+
+
+def _detach(conn: sqlite3.Connection, attached: tuple) -> None:
+    schemas, views = attached
+    if conn.in_transaction:
+        conn.rollback()
+    for view in views:
+        _temp_ddl(conn, f'DROP VIEW IF EXISTS temp."{view}"')
+    for schema in schemas:
+        conn.execute(f'DETACH DATABASE "{schema}"')
+
+
+# warm connections, keyed by (database file, thread) because sqlite3 connections
+# must not be used by two threads at the same time. They are opened with
+# check_same_thread=False, so that _close_pool() may close them from any thread.
+_POOL = {}
+_POOL_LOCK = threading.Lock()
+
+
+def _pool_key(dbpath: Path, readonly: bool) -> tuple:
+    return str(dbpath.resolve()), threading.get_ident(), readonly
+
+
+def _pool_acquire(dbpath: Path, readonly: bool = False) -> sqlite3.Connection:
+    with _POOL_LOCK:
+        conn = _POOL.pop(_pool_key(dbpath, readonly), None)
+    if conn is None:
+        _count("pool_miss")
+        conn = _connect(dbpath, readonly, pooled=True)
+    else:
+        _count("pool_hit")
+    return conn
+
+
+def _pool_release(dbpath: Path, conn: sqlite3.Connection, readonly: bool = False) -> None:
+    # same semantics as close(): whatever was not committed is gone
+    if conn.in_transaction:
+        conn.rollback()
+    with _POOL_LOCK:
+        # connections of threads that have ended would wait for the end of main()
+        alive = {t.ident for t in threading.enumerate()}
+        orphans = [_POOL.pop(k) for k in [k for k in _POOL if k[1] not in alive]]
+        key = _pool_key(dbpath, readonly)
+        if key not in _POOL:
+            _POOL[key] = conn
+            conn = None
+    for orphan in orphans:
+        _close_quietly(orphan)
+    if conn:
+        # nested Connection() to the same file in the same thread, keep only one
+        conn.close()
+
+
+def _close_quietly(conn: sqlite3.Connection) -> None:
+    try:
+        conn.close()
+    except Exception:
+        logging.exception("closing pooled connection")
+
+
+def _close_pool() -> None:
+    """
+    Close all pooled connections, e.g. at the end of main(). Never raises.
+    """
+    with _POOL_LOCK:
+        conns = list(_POOL.values())
+        _POOL.clear()
+    for conn in conns:
+        _close_quietly(conn)
+
+
+def _is_locked(ex: sqlite3.OperationalError) -> bool:
+    msg = str(ex)
+    return "database is locked" in msg or "database table is locked" in msg
+
+
+def _no_such_table(ex: sqlite3.OperationalError) -> bool:
+    return str(ex).startswith("no such table")
+
+
+def _retry_locked(fn, retries: int, backoff: float, *args):
+    """
+    Call fn(*args) and repeat it with jittered exponential backoff as long as
+    SQLite reports a lock, but no more than retries times.
+    Time lost in failed attempts and waits goes to lock_wait_sec.
+    """
+    attempt = 0
+    waited = 0.0
+    try:
+        while True:
+            t0 = perf_counter()
+            try:
+                return fn(*args)
+            except sqlite3.OperationalError as ex:
+                if attempt >= retries or not _is_locked(ex):
+                    raise
+                attempt += 1
+                import random
+                delay = backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logging.warning(f"{ex}, retry {attempt}/{retries} in {delay:.2f} s")
+                _count("lock_retries")
+                sleep_(delay)
+                waited += perf_counter() - t0
+    finally:
+        if waited:
+            _count("lock_wait_sec", waited)
+
+
+class _Cursor(sqlite3.Cursor):
+    """
+    Cursor that retries statements when the database is locked. executemany()
+    is only retried for a list or tuple of parameters, executescript() never.
+    Connection() sets retries and backoff.
+    """
+    retries = _LOCK_RETRIES
+    backoff = _LOCK_BACKOFF_SEC
+
+    def execute(self, sql, parameters=()):
+        return _retry_locked(super().execute, self.retries, self.backoff, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        # an iterator is partly consumed by the failed attempt, a retry would lose rows
+        retries = self.retries if isinstance(seq_of_parameters, Sequence) else 0
+        return _retry_locked(super().executemany, retries, self.backoff, sql, seq_of_parameters)
+
+    # no retry for executescript(): statements before the lock would run twice
+
+
+# normalized SQL -> [count, total seconds, max seconds, rows]
+_SQL_STATS = {}
+_SQL_LOCK = threading.Lock()
+# normalized SQL whose plan was logged already
+_SQL_EXPLAINED = set()
+_SLOW_QUERY_SEC = 0.5
+
+
+def _normalize_sql(sql: str) -> str:
+    """
+    Make statements that differ only in literals look the same.
+    """
+    import re
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(...)", sql)
+    return " ".join(sql.split())
+
+
+class _TracingCursor(_Cursor):
+    """
+    _Cursor that records time and rows per normalized statement, including
+    the time to fetch the rows, and logs the query plan of slow statements.
+    Connection() sets slow.
+    """
+    slow = _SLOW_QUERY_SEC
+    _key = None
+
+    def _record(self, dt: float, rows: int, executions: int = 0) -> None:
+        # _elapsed is the time of the current statement so far, execute and fetches
+        self._elapsed += dt
+        with _SQL_LOCK:
+            entry = _SQL_STATS.get(self._key)
+            if entry is None:
+                entry = _SQL_STATS[self._key] = [0, 0.0, 0.0, 0]
+            entry[0] += executions
+            entry[1] += dt
+            entry[2] = max(entry[2], self._elapsed)
+            entry[3] += rows
+        if self._elapsed >= self.slow and self._key not in _SQL_EXPLAINED:
+            _SQL_EXPLAINED.add(self._key)
+            self._explain(self._sql, self._parameters, self._elapsed)
+
+    def _traced(self, fn, sql, parameters, explain: bool):
+        self._key = _normalize_sql(sql)
+        self._sql = sql
+        self._parameters = parameters if explain else None
+        self._elapsed = 0.0
+        t0 = perf_counter()
+        result = fn(sql, parameters)
+        self._record(perf_counter() - t0, max(self.rowcount, 0), executions=1)
+        return result
+
+    def _explain(self, sql: str, parameters, dt: float) -> None:
+        lines = [f"slow statement ({dt:.3f} s): {' '.join(sql.split())[:500]}"]
+        if parameters is not None and sql.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+            try:
+                plan = self.connection.execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+                depth = {0: 0}
+                for node, parent, _, detail in plan:
+                    depth[node] = depth.get(parent, 0) + 1
+                    lines.append("  " * depth[node] + detail)
+            except sqlite3.Error as ex:
+                lines.append(f"  (no query plan: {ex})")
+        logging.warning("\n".join(lines))
+
+    def execute(self, sql, parameters=()):
+        return self._traced(super().execute, sql, parameters, explain=True)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._traced(super().executemany, sql, seq_of_parameters, explain=False)
+
+    def fetchone(self):
+        t0 = perf_counter()
+        row = super().fetchone()
+        if self._key:
+            self._record(perf_counter() - t0, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._key:
+            self._record(perf_counter() - t0, len(rows))
+        return rows
+
+    def fetchall(self):
+        t0 = perf_counter()
+        rows = super().fetchall()
+        if self._key:
+            self._record(perf_counter() - t0, len(rows))
+        return rows
+
+    def __next__(self):
+        t0 = perf_counter()
+        row = super().__next__()  # StopIteration passes through
+        if self._key:
+            self._record(perf_counter() - t0, 1)
+        return row
+
+
+def _sql_report(top: int = 10) -> str:
+    """
+    :return: the top statements by total and by maximum time as tables
+    """
+    with _SQL_LOCK:
+        stats = {sql: tuple(entry) for sql, entry in _SQL_STATS.items()}
+    lines = []
+    for title, index in (("total", 1), ("max", 2)):
+        lines.append(f"Top {top} statements by {title} time:")
+        lines.append(f"{'count':>9} {'total':>10} {'max':>10} {'rows':>11}  statement")
+        for sql, (count, total, longest, rows) in sorted(stats.items(), key=lambda kv: kv[1][index],
+                                                          reverse=True)[:top]:
+            lines.append(f"{count:>9,} {total:>9.3f}s {longest:>9.4f}s {rows:>11,}  {sql[:200]}")
+    return "\n".join(lines)
 
 
 class Connection:
@@ -379,22 +1705,41 @@ class Connection:
     conn: sqlite3.Connection
     cur: sqlite3.Cursor
 
-    def __init__(self, text: str ="some activities", dbpath: Union[str, Path] = None, quiet: bool = False):
+    def __init__(self, text: str ="some activities", dbpath: Union[str, Path] = None, quiet: bool = False,
+                 pooled: bool = None, readonly: bool = None, trace: bool = None, attach: Sequence[str] = None):
         """
         :param text: this text will show up in the logs to explain what was done in the scope of this Connection()
-        :param dbpath: name of the database file to use. Is defaulted from the respective parameter of main()
+        :param dbpath: name of the database file to use, or of a database configured as db.<name> in
+            [databases], or a shard("table", key). Is defaulted from the respective parameter of main()
         :param quiet: surpress log output
+        :param pooled: keep the physical connection warm for the next Connection() to the same
+            file in the same thread. Is defaulted from [databases]pool in johanna.ini (off).
+        :param readonly: open the database read-only, so that this Connection never blocks a
+            writer. Is defaulted from interactive() (on) or main() (off).
+        :param trace: record time and rows per statement for the report at the end of main(),
+            and log the query plan of statements slower than [databases]slow_query seconds (0.5).
+            Is defaulted from [databases]trace in johanna.ini (off).
+        :param attach: names of configured databases and sharded tables to attach read-only,
+            e.g. for joins: select ... from readings_all join archive.stations using (station)
         """
         # Application will not have to supplay database file name
         if dbpath:
             if isinstance(dbpath, str):
-                dbpath = Path(dbpath)
+                dbpath = _named_database(dbpath) or Path(dbpath)
         else:
             dbpath = _DBPATH
         assert isinstance(dbpath, Path)
         self._dbpath = dbpath
         self._text = text
         self.quiet = quiet
+        self.pooled = _flag("databases", "pool") if pooled is None else pooled
+        self.readonly = _READONLY if readonly is None else readonly
+        self.trace = _flag("databases", "trace") if trace is None else trace
+        self.slow = float(_db_option(dbpath, "slow_query", _SLOW_QUERY_SEC))
+        self.retries = int(_db_option(dbpath, "lock_retries", _LOCK_RETRIES))
+        self.backoff = float(_db_option(dbpath, "lock_backoff", _LOCK_BACKOFF_SEC))
+        self.attach = list(attach or ())
+        self._attached = None
 
     def __enter__(self):
         """
@@ -403,45 +1748,1215 @@ class Connection:
         self.t0 = perf_counter()
         if not self.quiet:
             logging.info(f"Connection to {_safe(self._dbpath.name)} for {self._text}")
-        self.conn = sqlite3.connect(self._dbpath)
-        self.cur = self.conn.cursor()
+        if self.pooled:
+            self.conn = _pool_acquire(self._dbpath, self.readonly)
+        else:
+            self.conn = _connect(self._dbpath, self.readonly)
+        if self.attach:
+            self._attached = _attach(self.conn, self.attach, self._dbpath)
+        self.cur = self._cursor()
         return self
 
     def commit(self):
-        self.conn.commit()
         # DONE sqlite3.OperationalError: database is locked – der Leseversuch wird von außen wiederholt
-        # TODO Retry in die Connection-Klasse einbauen statt im Aufrufer
+        # DONE Retry in die Connection-Klasse einbauen statt im Aufrufer
+        _retry_locked(self.conn.commit, self.retries, self.backoff)
+
+    _VERBS = {
+        "insert": "insert",
+        "ignore": "insert or ignore",
+        "replace": "insert or replace",
+        "upsert": "insert",
+    }
+
+    def bulk_insert(self, table_or_sql: str, rows: Iterable,
+                    batch_size: int = 10_000, commit_every: int = None,
+                    mode: str = "insert", columns: Sequence[str] = None,
+                    conflict: Sequence[str] = None) -> int:
+        """
+        Insert a (possibly huge) iterable of rows with executemany() in chunks of
+        batch_size rows. The iterable is consumed lazily, so memory stays flat even
+        for generators that yield millions of rows.
+            with Connection("load") as c:
+                c.bulk_insert("kvpairs", ((k, v) for k, v in source()), mode="ignore")
+
+        :param table_or_sql: a table name, or a complete insert statement with
+            placeholders (then mode, columns and conflict are ignored)
+        :param rows: iterable of tuples, or of dicts (named columns)
+        :param batch_size: number of rows per executemany()
+        :param commit_every: commit after (at least) that many rows. Defaults to a
+            single transaction that is committed at the end.
+        :param mode: "insert", "ignore" (insert or ignore), "replace" (insert or
+            replace) or "upsert" (on conflict do update, needs conflict)
+        :param columns: column names. Defaulted from the keys of the first row for dicts.
+        :param conflict: conflict target columns for mode="upsert"
+        :return: number of rows consumed from the iterable
+        """
+        if mode not in self._VERBS:
+            raise ValueError(f"mode='{mode}' must be one of {', '.join(self._VERBS)}")
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        it = iter(rows)
+        try:
+            first = next(it)
+        except StopIteration:
+            return 0
+        it = chain([first], it)
+
+        if table_or_sql.split() == [table_or_sql]:
+            sql = self._insert_sql(table_or_sql, first, mode, columns, conflict)
+        else:
+            sql = table_or_sql
+
+        t0 = perf_counter()
+        total = 0
+        batches = 0
+        uncommitted = 0
+        while True:
+            chunk = list(islice(it, batch_size))
+            if not chunk:
+                break
+            if not self.conn.in_transaction:
+                self.conn.execute("begin")
+            self.cur.executemany(sql, chunk)
+            total += len(chunk)
+            uncommitted += len(chunk)
+            batches += 1
+            if commit_every and uncommitted >= commit_every:
+                self.commit()
+                uncommitted = 0
+        if uncommitted:
+            self.commit()
+
+        dt = perf_counter() - t0
+        _count("bulk_rows", total)
+        _count("bulk_batches", batches)
+        _count("bulk_sec", dt)
+        if not self.quiet:
+            rate = total / dt if dt > 0 else 0.0
+            logging.info(f"bulk_insert: {total} rows in {batches} batches, {dt:.3f} s ({rate:,.0f} rows/s)")
+        return total
+
+    def _insert_sql(self, table: str, first, mode: str,
+                    columns: Sequence[str], conflict: Sequence[str]) -> str:
+        named = isinstance(first, Mapping)
+        if columns is None and named:
+            columns = list(first.keys())
+        if named:
+            values = ", ".join(f":{col}" for col in columns)
+        else:
+            values = ", ".join("?" * len(first))
+        target = f"{table} ({', '.join(columns)})" if columns else table
+        sql = f"{self._VERBS[mode]} into {target} values ({values})"
+        if mode == "upsert":
+            if not conflict or not columns:
+                raise ValueError("mode='upsert' needs columns and conflict")
+            updates = ", ".join(f"{col} = excluded.{col}" for col in columns if col not in conflict)
+            action = f"do update set {updates}" if updates else "do nothing"
+            sql += f" on conflict ({', '.join(conflict)}) {action}"
+        return sql
+
+    def stream(self, sql: str, parameters=(), batch_size: int = 10_000) -> Iterable[list]:
+        """
+        Run a query and yield its rows in lists of (at most) batch_size rows, so
+        that big results never sit in memory all at once.
+            for rows in c.stream("select * from readings where station = ?", (4711,)):
+                ...
+
+        :return: generator of lists of row tuples
+        """
+        cur = self._cursor()
+        try:
+            cur.execute(sql, parameters)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
+    def to_columns(self, sql: str, parameters=(), batch_size: int = 10_000) -> dict:
+        """
+        Run a query and collect the result column by column. Integer columns
+        become array.array("q"), real columns array.array("d") (with NULL as
+        nan), everything else a list. No row tuples are kept beyond one batch.
+
+        :return: dict column name -> array.array or list, in query order
+        """
+        cur = self._cursor()
+        try:
+            cur.execute(sql, parameters)
+            names = [d[0] for d in cur.description or ()]
+            columns = None
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                if columns is None:
+                    columns = [_new_column(values) for values in zip(*rows)]
+                for i, values in enumerate(zip(*rows)):
+                    columns[i] = _extend_column(columns[i], values)
+        finally:
+            cur.close()
+        if columns is None:
+            columns = [_new_column(()) for _ in names]
+        return dict(zip(names, columns))
+
+    def to_numpy(self, sql: str, parameters=(), batch_size: int = 10_000) -> dict:
+        """
+        Like to_columns(), but with NumPy arrays: int64 and float64 for numeric
+        columns (sharing memory with the collected arrays), object otherwise.
+        Falls back to to_columns() when NumPy is not installed.
+
+        :return: dict column name -> numpy.ndarray
+        """
+        columns = self.to_columns(sql, parameters, batch_size)
+        try:
+            import numpy
+        except ImportError:
+            logging.warning("to_numpy(): NumPy is not installed, returning array.array columns")
+            return columns
+        result = {}
+        for name, column in columns.items():
+            if isinstance(column, list):
+                values = numpy.empty(len(column), dtype=object)
+                values[:] = column
+                result[name] = values
+            else:
+                result[name] = numpy.frombuffer(column, dtype=numpy.int64 if column.typecode == "q" else numpy.float64)
+        return result
+
+    def _cursor(self) -> sqlite3.Cursor:
+        cur = self.conn.cursor(factory=_TracingCursor if self.trace else _Cursor)
+        cur.retries = self.retries
+        cur.backoff = self.backoff
+        if self.trace:
+            cur.slow = self.slow
+        return cur
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.conn.close()
+        if self.pooled:
+            self.cur.close()
+            if self._attached:
+                # the next user of the pooled connection expects a plain one
+                _detach(self.conn, self._attached)
+                self._attached = None
+            _pool_release(self._dbpath, self.conn, self.readonly)
+        else:
+            self.conn.close()
         self.cur = None
         self.conn = None
         dt = perf_counter() - self.t0
-        GLOBAL_STAT["connection_sec"] += dt
-        GLOBAL_STAT["connection_count"] += 1
+        _count("connection_sec", dt)
+        _count("connection_count")
         if not self.quiet:
             logging.info(f"Connection to {_safe(self._dbpath.name)} was open for {dt:.6f} s ({self._text})")
 
 
-def apply_schema(schema: Union[str, Path]):
+def _new_column(values: tuple):
+    """
+    Empty column for to_columns(), typed after the first non-NULL value.
+    """
+    import array
+    first = next((v for v in values if v is not None), None)
+    if isinstance(first, float):
+        return array.array("d")
+    if isinstance(first, int) or first is None:
+        return array.array("q")
+    return []
+
+
+def _extend_column(column, values: tuple):
+    """
+    Append values to a column from _new_column(), promoting it from integer to
+    real to list when the values do not fit.
+
+    :return: the column, possibly a new object
+    """
+    if isinstance(column, list):
+        column.extend(values)
+        return column
+    import array
+    n = len(column)
+    try:
+        column.extend(values)
+        return column
+    except (TypeError, OverflowError):
+        del column[n:]  # extend() may have stopped half way
+    numeric = all(v is None or isinstance(v, (int, float)) for v in values)
+    if numeric and not any(isinstance(v, int) and abs(v) > 2 ** 53 for v in values):
+        promoted = column if column.typecode == "d" else array.array("d", column)
+        promoted.extend(math.nan if v is None else v for v in values)
+        return promoted
+    promoted = column.tolist()
+    promoted.extend(values)
+    return promoted
+
+
+class AsyncConnection:
+    """
+    Connection() for asyncio code. All SQLite work runs on a dedicated executor
+    thread, so the event loop can go on with downloads while the database writes.
+        async with AsyncConnection("Charlotte") as c:
+            await c.execute("insert into kvpairs(k, v) values (?, ?)", (1, "eins"))
+            rows = await c.execute("select * from kvpairs")
+            await c.commit()
+    Use run() for everything else, it gets the underlying Connection:
+            await c.run(lambda conn: conn.bulk_insert("kvpairs", rows))
+    """
+
+    def __init__(self, text: str = "some activities", dbpath: Union[str, Path] = None, quiet: bool = False,
+                 pooled: bool = None, readonly: bool = None, attach: Sequence[str] = None):
+        """
+        Parameters are the same as for Connection().
+        """
+        self._connection = Connection(text=text, dbpath=dbpath, quiet=quiet, pooled=pooled, readonly=readonly,
+                                      attach=attach)
+        self._executor = None
+
+    async def run(self, fn, *args):
+        """
+        Run fn(connection, *args) on the executor thread.
+
+        :return: whatever fn returns
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, self._connection, *args)
+
+    async def execute(self, sql: str, parameters=()) -> list:
+        """
+        :return: all result rows (empty list for statements without result)
+        """
+        return await self.run(lambda c: c.cur.execute(sql, parameters).fetchall())
+
+    async def executemany(self, sql: str, seq_of_parameters) -> None:
+        await self.run(lambda c: c.cur.executemany(sql, seq_of_parameters))
+
+    async def commit(self) -> None:
+        await self.run(lambda c: c.commit())
+
+    async def bulk_insert(self, table_or_sql: str, rows: Iterable, **kwargs) -> int:
+        """
+        See Connection.bulk_insert(). Note that rows is consumed on the executor thread.
+        """
+        return await self.run(lambda c: c.bulk_insert(table_or_sql, rows, **kwargs))
+
+    async def __aenter__(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="johanna-db")
+        await self.run(lambda c: c.__enter__())
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await self.run(lambda c: c.__exit__(exc_type, exc_val, exc_tb))
+        finally:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+_SCHEMA_TABLES = """
+CREATE TABLE IF NOT EXISTS johanna_schema (
+    name TEXT PRIMARY KEY,
+    checksum TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    applied TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS johanna_migration (
+    schema TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    file TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied TEXT NOT NULL,
+    seconds REAL,
+    PRIMARY KEY (schema, version)
+);
+"""
+
+# statements that take longer are logged with their duration
+_SLOW_DDL_SEC = 1.0
+
+
+def _checksum(*texts: bytes) -> str:
+    import hashlib
+    h = hashlib.sha1()
+    for text in texts:
+        h.update(text)
+    return h.hexdigest()
+
+
+def _statements(sql: str) -> Iterable[str]:
+    """
+    Split an SQL script into complete statements (triggers included), also
+    when several statements share a line.
+    """
+    statement = ""
+    for part in sql.split(";"):
+        statement += part + ";"
+        if sqlite3.complete_statement(statement):
+            if statement.strip(" \t\r\n;"):
+                yield statement.strip()
+            statement = ""
+    # the last part got a ";" too many
+    rest = statement[:-1].strip()
+    if rest:
+        yield rest
+
+
+# leading comments of a statement
+_COMMENTS = r"^(\s*(--[^\n]*(\n|$)|/\*.*?\*/))*\s*"
+# BEGIN/COMMIT/END of scripts that manage their own transaction
+_TRANSACTION_CONTROL = re.compile(_COMMENTS + r"(BEGIN|COMMIT|END)\b(\s+\w+)?(\s+TRANSACTION)?\s*;?\s*$",
+                                  re.IGNORECASE | re.DOTALL)
+# statements that SQLite refuses (or ignores) within a transaction
+_NO_TRANSACTION = re.compile(_COMMENTS + r"(VACUUM|ATTACH|DETACH|PRAGMA\s+(\w+\.)?(journal_mode|foreign_keys)\b)",
+                             re.IGNORECASE | re.DOTALL)
+
+
+def _run_statement(c: "Connection", statement: str) -> None:
+    t0 = perf_counter()
+    c.cur.execute(statement)
+    dt = perf_counter() - t0
+    head = " ".join(statement.split()[:6])
+    if dt >= _SLOW_DDL_SEC or head.upper().startswith(("CREATE INDEX", "CREATE UNIQUE INDEX", "REINDEX", "VACUUM")):
+        logging.info(f"{head} ... {dt:.3f} s")
+
+
+def _run_script(c: "Connection", sql: str, before_commit=None) -> None:
+    """
+    Execute a script statement by statement in one transaction, logging index
+    builds and slow statements with their duration. BEGIN and COMMIT of the
+    script itself are skipped, its statements are part of the one transaction.
+    VACUUM, ATTACH, DETACH, PRAGMA journal_mode and PRAGMA foreign_keys cannot
+    be part of a transaction: what came before them is committed, they run on
+    their own, and a new transaction starts after them.
+
+    :param before_commit: called with c after the last statement, to record
+        in the same transaction that the script was applied
     """
-    Applies a schema (i.e. a set of create table and create index statements,
-    all with if exists, please) to the default database for a Connection().
-    This is intended to set up the working database for the program.
-    You can add new tables and indexes on the fly, but structural changes have
-    to be dealt with individually, and johanna does not provide support for
-    such.
+    c.cur.execute("BEGIN")
+    try:
+        for statement in _statements(sql):
+            if _TRANSACTION_CONTROL.match(statement):
+                continue
+            if _NO_TRANSACTION.match(statement):
+                c.commit()
+                _run_statement(c, statement)
+                c.cur.execute("BEGIN")
+            else:
+                _run_statement(c, statement)
+        if before_commit:
+            before_commit(c)
+        c.commit()
+    except Exception:
+        if c.conn.in_transaction:
+            c.conn.rollback()
+        raise
+
+
+def _schema_state(c: "Connection", name: str) -> Union[str, None]:
+    """
+    :return: checksum of what was applied for name, None if never applied
+    """
+    try:
+        row = c.cur.execute("SELECT checksum FROM johanna_schema WHERE name = ?", (name,)).fetchone()
+    except sqlite3.OperationalError as ex:
+        if not _no_such_table(ex):
+            raise
+        c.cur.executescript(_SCHEMA_TABLES)
+        row = None
+    return row[0] if row else None
 
-    :param schema: Path or str pointing to a SQL file.
+
+def _schema_applied(c: "Connection", name: str, checksum: str, version: int) -> None:
+    """
+    Record the new state and bump PRAGMA user_version, which counts schema
+    changes of the database file (handy for external tools). The caller commits.
     """
-    # TODO support more than one schema per db
+    c.cur.execute("INSERT OR REPLACE INTO johanna_schema (name, checksum, version, applied) VALUES (?, ?, ?, ?)",
+                  (name, checksum, version, datetime.now().isoformat(timespec="seconds")))
+    user_version = c.cur.execute("PRAGMA user_version").fetchone()[0]
+    c.cur.execute(f"PRAGMA user_version = {user_version + 1}")
+
+
+def apply_schema(schema: Union[str, Path], name: str = None):
+    """
+    Applies a schema to the default database for a Connection(). This is
+    intended to set up the working database for the program. Two flavours:
+
+    A SQL file, i.e. a set of create table and create index statements, all
+    with if not exists, please. It is executed in one transaction, and only
+    when it has changed since it was last applied. You can add new tables and
+    indexes on the fly. VACUUM, ATTACH, DETACH, PRAGMA journal_mode and PRAGMA
+    foreign_keys cannot be part of a transaction: they run on their own, and
+    split the script into a transaction before and one after them.
+
+    A folder of migrations named like 001_create.sql, 002_add_column.sql, ...
+    Each one that was not applied yet is executed once, in order, in its own
+    transaction. Use this for structural changes.
+
+    Several schemas can share a database as long as their names differ.
+    johanna keeps track in the tables johanna_schema and johanna_migration.
+
+    :param schema: Path or str pointing to a SQL file or a folder of migrations.
+    :param name: Name of the schema within the database, defaults to the file
+        name without .sql, or the folder name.
+    """
+    # DONE support more than one schema per db
     if isinstance(schema, str):
         schema = Path(schema)
     assert isinstance(schema, Path)
-    sql = schema.read_text()
-    logging.info(f"Applying {_safe(schema)}")
-    with Connection(text=f"apply {_safe(schema)}") as c:
-        c.cur.executescript(sql)
+    if schema.is_dir():
+        _apply_migrations(schema, name or schema.name)
+        return
+    name = name or schema.stem
+    sql = schema.read_bytes()
+    checksum = _checksum(sql)
+    # writes even when interactive() made Connections read-only by default
+    with Connection(text=f"apply {_safe(schema)}", quiet=True, readonly=False) as c:
+        if _schema_state(c, name) == checksum:
+            logging.info(f"Schema {name} from {_safe(schema)} is unchanged")
+            return
+        logging.info(f"Applying {_safe(schema)} as schema {name}")
+        t0 = perf_counter()
+        _run_script(c, sql.decode(), lambda c: _schema_applied(c, name, checksum, 0))
+        logging.info(f"Schema {name} applied in {perf_counter() - t0:.3f} s")
+
+
+def _apply_migrations(folder: Path, name: str) -> None:
+    migrations = []
+    for path in folder.glob("*.sql"):
+        number = path.name.split("_", 1)[0]
+        if number.isdigit():
+            migrations.append((int(number), path, path.read_bytes()))
+        else:
+            logging.warning(f"ignoring {_safe(path)}, migrations are named like 001_create.sql")
+    migrations.sort(key=lambda m: m[0])
+    if len({m[0] for m in migrations}) < len(migrations):
+        raise ValueError(f"migration numbers in {_safe(folder)} are not unique")
+    checksum = _checksum(*(f"{number}:".encode() + _checksum(sql).encode() for number, _, sql in migrations))
+
+    with Connection(text=f"migrate {name}", quiet=True, readonly=False) as c:
+        if _schema_state(c, name) == checksum:
+            logging.info(f"Schema {name} from {_safe(folder)} is unchanged")
+            return
+        applied = {version: file_checksum for version, file_checksum in c.cur.execute(
+            "SELECT version, checksum FROM johanna_migration WHERE schema = ?", (name,))}
+        version = max(applied, default=0)
+        for number, path, sql in migrations:
+            if number in applied:
+                if applied[number] != _checksum(sql):
+                    logging.warning(f"{_safe(path)} was changed after it had been applied, not applied again")
+                continue
+            logging.info(f"Applying migration {_safe(path)} to schema {name}")
+            t0 = perf_counter()
+
+            def record(c, number=number, path=path, sql=sql):
+                # in the transaction of the migration, so that it never runs twice
+                c.cur.execute("INSERT INTO johanna_migration (schema, version, file, checksum, applied, seconds) "
+                              "VALUES (?, ?, ?, ?, ?, ?)",
+                              (name, number, path.name, _checksum(sql), datetime.now().isoformat(timespec="seconds"),
+                               perf_counter() - t0))
+
+            _run_script(c, sql.decode(), record)
+            version = max(version, number)
+            logging.info(f"Migration {path.name} applied in {perf_counter() - t0:.3f} s")
+        _schema_applied(c, name, checksum, version)
+        c.commit()
+
+
+_CHECKPOINT_TABLE = """
+CREATE TABLE IF NOT EXISTS johanna_checkpoint (
+    source TEXT PRIMARY KEY,
+    marks TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+"""
+
+
+def _json_default(value):
+    # datetimes (and dates) are kept as ISO strings
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"checkpoint: cannot store {type(value).__name__}")
+
+
+def checkpoint(c: "Connection", source: str, **marks) -> dict:
+    """
+    Read or advance the watermark of an input source, kept in the table
+    johanna_checkpoint of the Connection's database. Advancing is part of the
+    Connection's transaction, so data and watermark are committed together, and
+    after a crash the job resumes behind the last commit:
+        with Connection("load DWD") as c:
+            done = checkpoint(c, "dwd").get("file", "")
+            for f in sorted(f for f in files() if f.name > done):
+                c.bulk_insert("readings", read(f))
+                checkpoint(c, "dwd", file=f.name, offset=0)
+                c.commit()
+
+    :param c: an open Connection
+    :param source: name of the input, e.g. a URL, a folder or a table
+    :param marks: values to store (JSON, datetimes become ISO strings). Given
+        keys replace the stored ones, other stored keys are kept.
+    :return: all marks of the source after the update ({} for a new source)
+    """
+    cur = c._cursor()
+    try:
+        try:
+            row = cur.execute("SELECT marks FROM johanna_checkpoint WHERE source = ?", (source,)).fetchone()
+        except sqlite3.OperationalError as ex:
+            if not _no_such_table(ex):
+                raise  # e.g. still locked, starting from scratch would be wrong
+            if not marks:
+                return {}
+            cur.execute(_CHECKPOINT_TABLE)
+            row = None
+        current = json.loads(row[0]) if row else {}
+        if marks:
+            current.update(marks)
+            cur.execute("INSERT OR REPLACE INTO johanna_checkpoint (source, marks, updated) VALUES (?, ?, ?)",
+                        (source, json.dumps(current, default=_json_default),
+                         datetime.now().isoformat(timespec="seconds")))
+            current = json.loads(json.dumps(current, default=_json_default))
+    finally:
+        cur.close()
+    return current
+
+
+def _worker_init(dotfolder: Path, inifile: Path, dbfolder: Path, dbname: str, log_queue, level: int) -> None:
+    """
+    Initializer for the worker processes of parallel_map(). Sets up the module
+    globals like the parent has them, without touching files, and forwards
+    the log records to the parent.
+
+    :param level: level of the parent's root logger, records below are not forwarded
+    """
+    global _DOTFOLDER, _INIFILE, _CONFIG, _DBFOLDER, _DBNAME, _DBPATH
+    global _ROTATING_FILE_HANDLER, _STDOUT_HANDLER, _FILE_HANDLER, _LOG_QUEUE, _LOG_LISTENER
+    _DOTFOLDER = dotfolder
+    _INIFILE = inifile
+    import configparser
+    _CONFIG = configparser.ConfigParser()
+    if inifile:
+        _CONFIG.read(inifile)
+    _DBFOLDER = dbfolder
+    _DBNAME = dbname
+    _DBPATH = dbfolder / dbname if dbfolder and dbname else None
+    # a forked child must neither use nor close the parent's connections and files
+    _POOL.clear()
+    _reset_metrics()
+    logger = logging.getLogger()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    _ROTATING_FILE_HANDLER = _STDOUT_HANDLER = _FILE_HANDLER = None
+    _LOG_QUEUE = _LOG_LISTENER = None
+    from logging.handlers import QueueHandler
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(level)
+
+
+def _worker_call(func, item) -> tuple:
+    """
+    Runs in the worker process.
+
+    :return: (ok, result, metrics collected during the call)
+    """
+    _reset_metrics()
+    try:
+        result = func(item)
+        ok = True
+    except Exception:
+        logging.exception(f"parallel_map: {getattr(func, '__name__', func)}({item!r:.80}) failed")
+        result = None
+        ok = False
+    _close_pool()
+    return ok, result, _metrics_snapshot()
+
+
+def parallel_map(func, iterable: Iterable, workers: int = None, chunksize: int = 1) -> list:
+    """
+    Like map(func, iterable), but spread over worker processes to use more
+    than one core. The workers know the dotfolder, johanna.ini and default
+    database of the parent, so Connection() and get() work there as usual.
+    Their log records end up in the parent's logs (and current.log), and their
+    statistics are added to the parent's.
+    An exception in func is logged and flags the run as ERROR, the result for
+    that item is None.
+
+    :param func: function of one argument. Must be picklable, i.e. defined at
+        module level.
+    :param iterable: the arguments for func
+    :param workers: number of processes, defaults to the number of CPUs
+    :param chunksize: number of items sent to a worker at once
+    :return: list of results in the order of iterable
+    """
+    import multiprocessing
+    from logging.handlers import QueueListener
+    log_queue = multiprocessing.Queue()
+    root = logging.getLogger()
+    listener = QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    listener.start()
+    results = []
+    failed = 0
+    try:
+        initargs = (_DOTFOLDER, _INIFILE, _DBFOLDER, _DBNAME, log_queue, root.level)
+        with multiprocessing.Pool(workers, initializer=_worker_init, initargs=initargs) as pool:
+            calls = pool.imap(_CallIn(func), iterable, chunksize)
+            for ok, result, metrics in calls:
+                _merge_metrics(metrics)
+                if not ok:
+                    failed += 1
+                results.append(result)
+    finally:
+        listener.stop()
+    if failed:
+        logging.error(f"parallel_map: {failed} of {len(results)} calls failed")
+        flag_as_error()
+    return results
+
+
+class _CallIn:
+    """
+    Picklable partial of _worker_call().
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, item):
+        return _worker_call(self.func, item)
+
+
+def _tracing() -> bool:
+    # tracemalloc can only be running if someone imported it
+    return "tracemalloc" in sys.modules and sys.modules["tracemalloc"].is_tracing()
+
+
+class _MemoryProbe:
+    """
+    Memory reporting for main(), mode from $JOHANNA_MEMORY or [profiling]memory:
+        off          nothing
+        rss          peak resident set size of the process (cheap, default); per run
+                     in daemon(), where the high-water mark is reset before each run
+                     (Linux only, elsewhere the peak is not measured in daemon runs)
+        tracemalloc  traced Python allocations with [profiling]frames frames per
+                     allocation, and the top [profiling]top allocation sites by
+                     growth between start and end of the run
+    """
+    MODES = ("off", "rss", "tracemalloc")
+
+    def __init__(self, mode: str = "rss", frames: int = 1, top: int = 10, per_run: bool = False):
+        if mode not in self.MODES:
+            logging.warning(f"unknown memory mode '{mode}', using rss")
+            mode = "rss"
+        self.mode = mode
+        self.frames = frames
+        self.top = top
+        self.per_run = per_run
+        self._snapshot = None
+        self._hwm_reset = False
+
+    @classmethod
+    def from_config(cls, per_run: bool = False) -> "_MemoryProbe":
+        mode = os.environ.get("JOHANNA_MEMORY") or get("profiling", "memory", "rss")
+        return cls(mode.lower(), frames=int(get("profiling", "frames", 1)), top=int(get("profiling", "top", 10)),
+                   per_run=per_run)
+
+    def start(self) -> None:
+        if self.mode == "rss" and self.per_run:
+            try:
+                # 5 resets the peak RSS (VmHWM) of the process, since Linux 4.0
+                with open("/proc/self/clear_refs", "w") as fh:
+                    fh.write("5")
+                self._hwm_reset = True
+            except OSError:
+                self._hwm_reset = False
+        if self.mode == "tracemalloc":
+            import tracemalloc
+            tracemalloc.start(self.frames)
+            self._snapshot = tracemalloc.take_snapshot()
+
+    def peak_mb(self) -> Union[float, None]:
+        if self.mode == "tracemalloc" and _tracing():
+            import tracemalloc
+            return tracemalloc.get_traced_memory()[1] / 1024.0 / 1024
+        if self.mode == "rss" and self.per_run:
+            # ru_maxrss would be the peak of the whole daemon
+            return self._proc_status_mb("VmHWM") if self._hwm_reset else None
+        if self.mode == "rss" and resource:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # kB on Linux, bytes on macOS
+            return peak / 1024.0 / 1024 if sys.platform == "darwin" else peak / 1024.0
+        return None
+
+    @staticmethod
+    def _proc_status_mb(field: str) -> Union[float, None]:
+        try:
+            with open("/proc/self/status") as fh:
+                for line in fh:
+                    if line.startswith(field + ":"):
+                        return int(line.split()[1]) / 1024.0
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    @staticmethod
+    def _current_rss_mb() -> Union[float, None]:
+        try:
+            with open("/proc/self/statm") as fh:
+                return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024.0 / 1024
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def report(self) -> str:
+        if self.mode == "off":
+            return "Memory: not measured"
+        if self.mode == "rss":
+            current = self._current_rss_mb()
+            current = "?" if current is None else f"{current:0.1f} MB"
+            peak = self.peak_mb()
+            peak = "?" if peak is None else f"{peak:0.1f} MB"
+            return f"Memory: RSS current = {current}, peak = {peak}"
+        if not _tracing():
+            return "Memory: tracemalloc not running"
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        lines = ["Memory: current = %0.1f MB, peak = %0.1f MB" % (current / 1024.0 / 1024, peak / 1024.0 / 1024)]
+        if self._snapshot and self.top > 0:
+            # johanna's own bookkeeping, the profilers and logging are not the job's allocations
+            stdlib = os.path.dirname(os.__file__)
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, os.path.join(stdlib, "cProfile.py")),
+                tracemalloc.Filter(False, os.path.join(stdlib, "profile.py")),
+                tracemalloc.Filter(False, os.path.join(os.path.dirname(logging.__file__), "*")),
+            ))
+            key = "traceback" if self.frames > 1 else "lineno"
+            lines.append(f"Top {self.top} allocation sites (size, growth during run):")
+            for stat in snapshot.compare_to(self._snapshot, key)[:self.top]:
+                # tracemalloc keeps the oldest frame first, the allocation site is the newest
+                frames = list(stat.traceback)[::-1]
+                lines.append(f"  {stat.size / 1024:10.1f} kB {stat.size_diff / 1024:+10.1f} kB "
+                             f"{stat.count:8} blocks  {_safe(frames[0])}")
+                for frame in frames[1:]:
+                    lines.append(f"  {'':>48}{_safe(frame)}")
+        return "\n".join(lines)
+
+    def stop(self) -> None:
+        if self.mode == "tracemalloc" and _tracing():
+            import tracemalloc
+            tracemalloc.stop()
+            self._snapshot = None
+
+
+class _CpuProfiler:
+    """
+    Optional CPU profile of the callback in main(), mode from $JOHANNA_CPU or [profiling]cpu:
+        off       nothing (default)
+        cprofile  deterministic profile with cProfile, written to <dotfolder>/profile.pstats
+        sample    stack sampling every [profiling]interval seconds (0.005) of process
+                  time via SIGPROF, written to <dotfolder>/profile.collapsed
+    Both log a summary of the top [profiling]cpu-top (20) functions by cumulative time.
+    """
+    MODES = ("off", "cprofile", "sample")
+
+    def __init__(self, mode: str = "off", interval: float = 0.005, top: int = 20):
+        if mode not in self.MODES:
+            logging.warning(f"unknown cpu profiling mode '{mode}', using off")
+            mode = "off"
+        if mode == "sample" and not (hasattr(signal, "setitimer")
+                                     and threading.current_thread() is threading.main_thread()):
+            logging.warning("stack sampling needs SIGPROF and the main thread, using cprofile")
+            mode = "cprofile"
+        self.mode = mode
+        self.interval = interval
+        self.top = top
+        self._profile = None
+        self._samples = None
+        self._previous_handler = None
+
+    @classmethod
+    def from_config(cls) -> "_CpuProfiler":
+        mode = os.environ.get("JOHANNA_CPU") or get("profiling", "cpu", "off")
+        return cls(mode.lower(), interval=float(get("profiling", "interval", 0.005)),
+                   top=int(get("profiling", "cpu-top", 20)))
+
+    def start(self) -> None:
+        if self.mode == "cprofile":
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.mode == "sample":
+            self._samples = defaultdict(int)
+            self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def _sample(self, signum, frame) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+            frame = frame.f_back
+        self._samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        if self.mode == "cprofile" and self._profile:
+            self._profile.disable()
+        elif self.mode == "sample" and self._samples is not None:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+
+    def write(self, folder: Path) -> str:
+        """
+        Write the profile to folder.
+
+        :return: summary for the log, empty when not profiling
+        """
+        if self.mode == "cprofile" and self._profile:
+            import pstats
+            path = folder / "profile.pstats"
+            self._profile.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(self.top)
+            return f"CPU profile written to {_safe(path)}\n" + _safe(out.getvalue().strip())
+        if self.mode == "sample" and self._samples is not None:
+            path = folder / "profile.collapsed"
+            with open(path, "w") as fh:
+                for stack, n in sorted(self._samples.items()):
+                    fh.write(f"{stack} {n}\n")
+            # cumulative: every function counts once per sample it is part of
+            total = sum(self._samples.values())
+            cumulative = defaultdict(int)
+            for stack, n in self._samples.items():
+                for function in set(stack.split(";")):
+                    cumulative[function] += n
+            lines = [f"CPU samples written to {_safe(path)} ({total} samples every {self.interval} s)",
+                     f"{'samples':>8} {'cum %':>6}  function"]
+            for function, n in sorted(cumulative.items(), key=lambda kv: kv[1], reverse=True)[:self.top]:
+                lines.append(f"{n:>8} {100.0 * n / total:>6.1f}  {function}")
+            return "\n".join(lines)
+        return ""
+
+
+_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    job TEXT NOT NULL,
+    script TEXT,
+    start TEXT NOT NULL,
+    duration REAL,
+    cpu REAL,
+    peak_mb REAL,
+    error INTEGER,
+    subject TEXT,
+    stats TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_job_start ON runs(job, start);
+"""
+
+
+def _history_db(dotfolder: Path = None) -> sqlite3.Connection:
+    """
+    johanna's own database of past runs, <dotfolder>/history.sqlite
+    """
+    conn = sqlite3.connect(Path(dotfolder or _DOTFOLDER) / "history.sqlite", timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_HISTORY_SCHEMA)
+    return conn
+
+
+def _regression(job: str, duration: float, peak_mb: float) -> str:
+    """
+    Compare a run with the median of the recent successful runs of the same job.
+    Configured in [history]: factor (2.0), window (10 runs), min-runs (3), and
+    min-duration (1.0 s) and min-peak-mb (10) below which nothing counts as a regression.
+
+    :return: remark for the mail subject, empty if nothing regressed
+    """
+    factor = float(get("history", "factor", 2.0))
+    window = int(get("history", "window", 10))
+    min_runs = int(get("history", "min-runs", 3))
+    with closing(_history_db()) as conn:
+        rows = conn.execute("SELECT duration, peak_mb FROM runs WHERE job = ? AND error = 0 "
+                            "ORDER BY start DESC LIMIT ?", (job, window)).fetchall()
+    if len(rows) < min_runs:
+        return ""
+    import statistics
+    remarks = []
+    for label, value, column, floor in (("duration", duration, "duration", float(get("history", "min-duration", 1.0))),
+                                        ("memory", peak_mb, "peak_mb", float(get("history", "min-peak-mb", 10)))):
+        values = [r[column] for r in rows if r[column] is not None]
+        median = statistics.median(values) if values else 0
+        if value is not None and value >= floor and median > 0 and value > factor * median:
+            remarks.append(f"{label} {value / median:.1f}x median")
+    return f"REGRESSION: {', '.join(remarks)}" if remarks else ""
+
+
+def _record_run(job: str, start: datetime, duration: float, cpu: float, peak_mb: float, subject: str) -> None:
+    with closing(_history_db()) as conn, conn:
+        conn.execute("INSERT INTO runs (job, script, start, duration, cpu, peak_mb, error, subject, stats) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (job, Path(sys.argv[0]).name, start.isoformat(timespec="seconds"), duration, cpu,
+                      peak_mb, int(ERROR), subject, json.dumps(_metrics_snapshot()[0])))
+
+
+def history(job: str = None, limit: int = 20, dotfolder: Union[Path, str] = None) -> list:
+    """
+    Recent runs recorded by main(), newest first.
+    Also available as: python -m johanna history
+
+    :param job: only runs with this mail_subject
+    :param limit: maximum number of runs
+    :param dotfolder: defaults to the current one, or $JOHANNA, or ~/.johanna
+    :return: list of dicts with job, script, start, duration, cpu, peak_mb,
+        error, subject and stats
+    """
+    dotfolder = _DOTFOLDER if _DOTFOLDER and not dotfolder else _resolve_dotfolder(dotfolder)
+    with closing(_history_db(dotfolder)) as conn:
+        where, params = ("WHERE job = ?", [job]) if job else ("", [])
+        rows = conn.execute(f"SELECT * FROM runs {where} ORDER BY start DESC, id DESC LIMIT ?",
+                            params + [limit]).fetchall()
+    runs = [dict(row) for row in rows]
+    for run in runs:
+        run["stats"] = json.loads(run["stats"]) if run["stats"] else {}
+    return runs
+
+
+_FETCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fetched (
+    url TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    bytes INTEGER,
+    fetched TEXT NOT NULL,
+    checked TEXT NOT NULL
+);
+"""
+_FETCH_LOCK = threading.Lock()
+_FETCH_LOCAL = threading.local()
+
+
+class Fetched(NamedTuple):
+    url: str
+    path: Path
+    changed: bool  # False if the server said 304 Not Modified
+    bytes: int     # bytes transferred
+    seconds: float
+
+
+def _fetch_db() -> sqlite3.Connection:
+    """
+    johanna's own database of downloaded URLs with their validators, <dotfolder>/fetch.sqlite
+    """
+    conn = sqlite3.connect(_DOTFOLDER / "fetch.sqlite", timeout=10)
+    conn.executescript(_FETCH_SCHEMA)
+    return conn
+
+
+def _fetch_session() -> "requests.Session":
+    """
+    One HTTP session per thread, which keeps its connections alive between fetches.
+    """
+    session = getattr(_FETCH_LOCAL, "session", None)
+    if session is None:
+        import requests
+        session = _FETCH_LOCAL.session = requests.Session()
+    return session
+
+
+def _fetch_target(url: str) -> Path:
+    # <dotfolder>/downloads/<hash>-<last part of the URL>, unique per URL
+    import hashlib
+    from urllib.parse import urlsplit
+    name = Path(urlsplit(url).path).name or "index"
+    folder = Path(get("fetch", "folder", _DOTFOLDER / "downloads"))
+    return folder / f"{hashlib.sha1(url.encode()).hexdigest()[:12]}-{name}"
+
+
+def fetch(url: str, target: Union[str, Path] = None, force: bool = False) -> Fetched:
+    """
+    Download a URL to a file, streaming, with a conditional GET: if the file of
+    the last download is still there, the server is asked with its ETag and
+    Last-Modified whether anything changed, and a 304 answer leaves the file alone.
+    Bytes, downloads, hits (304) and time are reported in the statistics,
+    the latency per request as histogram fetch_latency.
+    Timeouts are configured in [fetch] (connect-timeout 5, read-timeout 60 seconds).
+
+    :param url: what to get
+    :param target: where to put it. Defaults to a file in <dotfolder>/downloads
+        (or [fetch]folder) named after the URL.
+    :param force: download even if not modified
+    :return: Fetched(url, path, changed, bytes, seconds)
+    """
+    target = Path(target) if target else _fetch_target(url)
+    with _FETCH_LOCK, closing(_fetch_db()) as db:
+        row = db.execute("SELECT path, etag, last_modified FROM fetched WHERE url = ?", (url,)).fetchone()
+    headers = {}
+    if row and not force and row[0] == str(target) and target.exists():
+        if row[1]:
+            headers["If-None-Match"] = row[1]
+        if row[2]:
+            headers["If-Modified-Since"] = row[2]
+    timeout = (float(get("fetch", "connect-timeout", 5)), float(get("fetch", "read-timeout", 60)))
+    t0 = perf_counter()
+    size = 0
+    try:
+        with _fetch_session().get(url, headers=headers, timeout=timeout, stream=True) as r:
+            latency = perf_counter() - t0
+            if r.status_code == 304:
+                changed = False
+            else:
+                r.raise_for_status()
+                changed = True
+                target.parent.mkdir(parents=True, exist_ok=True)
+                part = target.with_name(target.name + ".part")
+                with open(part, "wb") as fh:
+                    for chunk in r.iter_content(chunk_size=1024 * 1024):
+                        fh.write(chunk)
+                        size += len(chunk)
+                os.replace(part, target)
+            etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+    except Exception:
+        _count("fetch_failed")
+        raise
+    finally:
+        _count("fetch_sec", perf_counter() - t0)
+    now = datetime.now().isoformat(timespec="seconds")
+    with _FETCH_LOCK, closing(_fetch_db()) as db, db:
+        if changed:
+            db.execute("INSERT OR REPLACE INTO fetched (url, path, etag, last_modified, bytes, fetched, checked) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)", (url, str(target), etag, last_modified, size, now, now))
+        else:
+            db.execute("UPDATE fetched SET checked = ? WHERE url = ?", (now, url))
+    _count("fetch_downloads" if changed else "fetch_hits")
+    _count("fetch_bytes", size)
+    histogram("fetch_latency", latency)
+    dt = perf_counter() - t0
+    logging.info(f"fetch {_safe(url)}: " + (f"{size:,} bytes in {dt:.3f} s" if changed else "not modified"))
+    return Fetched(url, target, changed, size, dt)
+
+
+def fetch_many(urls: Iterable, workers: int = None, force: bool = False) -> list:
+    """
+    fetch() many URLs with a bounded pool of threads. A failing download is
+    logged and flags the run as ERROR, its result is None.
+
+    :param urls: URLs, or (url, target) tuples
+    :param workers: number of parallel downloads, defaults to [fetch]workers (4)
+    :return: list of Fetched (or None), in the order of urls
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    jobs = [(u, None) if isinstance(u, str) else tuple(u) for u in urls]
+    workers = workers or int(get("fetch", "workers", 4))
+
+    def one(job):
+        try:
+            return fetch(job[0], job[1], force=force)
+        except Exception:
+            logging.exception(f"fetch {_safe(job[0])}")
+            flag_as_error()
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs) or 1))) as pool:
+        return list(pool.map(one, jobs))
+
+
+def _docopt_errors() -> tuple:
+    """
+    docopt's exceptions, for an except clause (evaluated only when there is an
+    exception). They can only occur if the application imported docopt.
+    """
+    docopt = sys.modules.get("docopt")
+    return (docopt.DocoptExit, docopt.DocoptLanguageError) if docopt else ()
+
+
+def _is_coroutine_function(callback) -> bool:
+    # same as inspect.iscoroutinefunction() for plain functions, without importing inspect
+    if getattr(getattr(callback, "__code__", None), "co_flags", 0) & 0x80:  # CO_COROUTINE
+        return True
+    if "inspect" in sys.modules or not hasattr(callback, "__code__"):
+        import inspect
+        return inspect.iscoroutinefunction(callback)
+    return False
+
+
+def _run_job(callback, mail_subject: str, start: datetime, pc0: float, pt0: float, per_run: bool = False) -> bool:
+    """
+    One run of a job, from the callback to the mail. Logging must be initialized.
+
+    :param start, pc0, pt0: when the run began (wall clock, perf_counter(), process_time())
+    :param per_run: the process outlives the run (daemon), so measure the memory of this run only
+    :return: True if the run was stopped by KeyboardInterrupt
+    """
+    global ERROR
+    interrupted = False
+    memory = _MemoryProbe.from_config(per_run=per_run)
+    memory.start()
+    memory_report = ""
+    profiler = _CpuProfiler.from_config()
+    try:
+        try:
+            profiler.start()
+            try:
+                if _is_coroutine_function(callback):
+                    import asyncio
+                    asyncio.run(callback())
+                else:
+                    callback()
+            finally:
+                profiler.stop()
+            # DONE better formatting for statistics
+            logging.info("Statistics:\n" + _stat_report())
+        except _docopt_errors() as ex:
+            ERROR = True
+            logging.exception(type(ex).__name__)
+        logging.info("Time total: %0.1fs (%0.1fs process)" % (perf_counter() - pc0, process_time() - pt0))
+        if _SPANS:
+            logging.info("Spans:\n" + _span_report())
+        if _SQL_STATS:
+            logging.info("SQL:\n" + _sql_report(int(get("databases", "trace_top", 10))))
+        memory_report = memory.report()
+        logging.info(memory_report)
+    except KeyboardInterrupt:
+        interrupted = True
+        logging.warning("Caught KeyboardInterrupt")
+    except Exception as ex:
+        ERROR = True
+        logging.exception("Sorry.")
+    try:
+        cpu_report = profiler.write(_DOTFOLDER)
+        if cpu_report:
+            logging.info(cpu_report)
+    except Exception:
+        logging.exception("cpu profile")
+    subject = mail_subject
+    record = _flag("history", "enabled", True)
+    duration, cpu = perf_counter() - pc0, process_time() - pt0
+    peak_mb = memory.peak_mb()
+    if record:
+        try:
+            remark = _regression(mail_subject, duration, peak_mb)
+            if remark:
+                logging.warning(remark)
+                subject = f"{mail_subject} ({remark})"
+        except Exception:
+            logging.exception("run history")
+    memory.stop()
+    _shoot_mail(subject, appendix=memory_report if memory.mode == "tracemalloc" else "")
+    # the statistics above were logged before the mail was sent
+    mail_stats = {k: v for k, v in _metrics_snapshot()[0].items() if k.startswith("mail_")}
+    if mail_stats:
+        logging.info("Mail: " + ", ".join(f"{k} = {_fmt(v)}" for k, v in sorted(mail_stats.items())))
+    if record:
+        try:
+            _record_run(mail_subject, start, duration, cpu, peak_mb, _mail_subject(subject))
+        except Exception:
+            logging.exception("run history")
+    return interrupted
 
 
 def main(callback,
@@ -455,6 +2970,7 @@ def main(callback,
         <dotfolder>/johanna.ini
 
     :param callback: The main code for execution. Needs no try's to be safe.
+        May be a coroutine function (async def), which is then run in an event loop.
     :param dotfolder: A Path or str pointing to the  working folder holding
         the .ini file, the log files, and (by default) the databases. Will be
         taken from $JOHANNA (or $HOME/.johanna as a fallback) if not specified.
@@ -472,31 +2988,14 @@ def main(callback,
         _initialize(dotfolder=dotfolder, dbname=dbname, is_interactive=True)
         return
     # background mode: with
-    global ERROR
-    tracemalloc.start()
+    start = datetime.now()
     pc0 = perf_counter()
     pt0 = process_time()
     _initialize(dotfolder=dotfolder, dbname=dbname)
-    try:
-        try:
-            callback()
-            # TODO better formatting for statistics
-            logging.info("Statistics: " + json.dumps(GLOBAL_STAT, indent=4))
-        except DocoptExit as ex:
-            ERROR = True
-            logging.exception("DocoptExit")
-        except DocoptLanguageError as ex:
-            ERROR = True
-            logging.exception("DocoptLanguageError")
-        logging.info("Time total: %0.1fs (%0.1fs process)" % (perf_counter() - pc0, process_time() - pt0))
-        current, peak = tracemalloc.get_traced_memory()
-        logging.info("Memory: current = %0.1f MB, peak = %0.1f MB" % (current / 1024.0 / 1024, peak / 1024.0 / 1024))
-    except KeyboardInterrupt:
-        logging.warning("Caught KeyboardInterrupt")
-    except Exception as ex:
-        ERROR = True
-        logging.exception("Sorry.")
-    _shoot_mail(mail_subject)
+    _start_outbox_flush()
+    _run_job(callback, mail_subject, start, pc0, pt0)
+    _close_pool()
+    _finish_outbox_flush()
     logging.info("Ciao.")
     print()
     print()
@@ -504,10 +3003,14 @@ def main(callback,
 
 def interactive(
          dotfolder: Union[Path, str] = None,
-         dbname: str = "johanna.sqlite"  # set default for Connection context handler
+         dbname: str = "johanna.sqlite",  # set default for Connection context handler
+         readonly: bool = True,
+         in_memory: bool = False
          ) -> None:
     """
     Convenience function to avoid johanna.main(None,...) in Jupyter notebooks.
+    Connections are read-only by default, so notebooks never block or get
+    blocked by the background job writing the same database.
 
     :param dotfolder: A Path or str pointing to the  working folder holding
         the .ini file, the log files, and (by default) the databases. Will be
@@ -516,10 +3019,190 @@ def interactive(
     :param dbname: Name of the database file that will be used by default for e
         new Connection(). Do not overwrite the default when only one database is
         used.
+    :param readonly: Connections are read-only unless specified otherwise.
+    :param in_memory: work on an in-memory copy of the database, see snapshot()
     """
     # DONE harden about double execution (easily happens in notebooks)
     if not _DOTFOLDER:
-        _initialize(dotfolder=dotfolder, dbname=dbname, is_interactive=True)
+        _initialize(dotfolder=dotfolder, dbname=dbname, is_interactive=True, readonly=readonly)
     else:
         logging.info("johanna: already intialized")
+    if in_memory:
+        snapshot()
+
+
+
+class _Cron:
+    """
+    Classic crontab schedule with five fields: minute hour day-of-month month
+    day-of-week (0 or 7 is Sunday). Fields take *, lists, ranges and steps like
+    "*/15", "1-5" or "0,30". As with cron, if both day fields are restricted,
+    a day matches if either of them does. Times are local.
+    """
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr: str):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron expression '{expr}' needs 5 fields: minute hour day month weekday")
+        self.expr = expr
+        fields = [self._field(part, lo, hi, expr) for part, (lo, hi) in zip(parts, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months = fields[:4]
+        self.weekdays = {d % 7 for d in fields[4]}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _field(text: str, lo: int, hi: int, expr: str) -> set:
+        values = set()
+        for item in text.split(","):
+            spec, _, step = item.partition("/")
+            try:
+                if spec == "*":
+                    first, last = lo, hi
+                elif "-" in spec:
+                    first, last = (int(v) for v in spec.split("-", 1))
+                else:
+                    first = int(spec)
+                    last = hi if step else first
+                step = int(step) if step else 1
+            except ValueError:
+                raise ValueError(f"cron expression '{expr}': cannot read '{item}'") from None
+            if not lo <= first <= last <= hi or step < 1:
+                raise ValueError(f"cron expression '{expr}': '{item}' not within {lo}-{hi}")
+            values.update(range(first, last + 1, step))
+        return values
+
+    def _day_matches(self, t: datetime) -> bool:
+        dom = t.day in self.days
+        dow = t.isoweekday() % 7 in self.weekdays
+        if self.any_day:
+            return dow
+        if self.any_weekday:
+            return dom
+        return dom or dow
+
+    def next(self, after: datetime) -> datetime:
+        """
+        :return: the first matching minute after the given time
+        """
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=5 * 366)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron expression '{self.expr}' never matches")
+
+
+class _Job:
+    """
+    A callback of daemon() with its schedule.
+    """
+    def __init__(self, schedule: Union[float, str], callback, mail_subject: str = None):
+        self.callback = callback
+        self.mail_subject = mail_subject or getattr(callback, "__name__", "Johanna")
+        now = datetime.now()
+        if isinstance(schedule, str):
+            self.cron = _Cron(schedule)
+            self.interval = None
+            self.next_run = self.cron.next(now)
+        else:
+            if schedule <= 0:
+                raise ValueError(f"interval of job {self.mail_subject} must be positive")
+            self.cron = None
+            self.interval = timedelta(seconds=schedule)
+            self.next_run = now
+
+    def schedule_next(self, now: datetime) -> None:
+        if self.cron:
+            self.next_run = self.cron.next(now)
+        else:
+            # missed intervals are skipped, not made up for
+            while self.next_run <= now:
+                self.next_run += self.interval
 
+    def __str__(self):
+        return f"{self.mail_subject} ({self.cron.expr if self.cron else f'every {self.interval}'})"
+
+
+def _reset_run() -> None:
+    """
+    Forget ERROR state, statistics, spans and SQL traces of the previous job run.
+    """
+    global ERROR
+    ERROR = False
+    _reset_metrics()
+    with _SPANS_LOCK:
+        _SPANS.clear()
+    with _SQL_LOCK:
+        _SQL_STATS.clear()
+        _SQL_EXPLAINED.clear()
+
+
+def _sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+
+def daemon(jobs: Sequence[tuple],
+           dotfolder: Union[Path, str] = None,
+           dbname: str = "johanna.sqlite"
+           ) -> None:
+    """
+    Run several jobs in one long-living process, which keeps imports, configuration,
+    logging and (with [databases]pool) connections warm. Each job run gets its own
+    current.log, statistics, ERROR state, history entry and mail, like a main() run.
+        johanna.daemon([
+            (300, load_dwd, "DWD"),               # every 5 minutes, first run right away
+            ("30 3 * * *", vacuum, "Vacuum"),     # daily at 03:30
+        ])
+    Jobs run one after the other; a job that gets due while another one runs
+    starts afterwards, and missed intervals are skipped. Stops on Ctrl+C or SIGTERM.
+
+    :param jobs: (schedule, callback, mail_subject) tuples. schedule is an interval in
+        seconds or a cron expression (minute hour day month weekday), mail_subject
+        defaults to the name of the callback.
+    :param dotfolder: see main()
+    :param dbname: see main()
+    """
+    schedule = [_Job(*job) for job in jobs]
+    if not schedule:
+        raise ValueError("daemon() needs at least one job")
+    _initialize(dotfolder=dotfolder, dbname=dbname)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _sigterm)
+    logging.info("Daemon jobs: " + ", ".join(str(job) for job in schedule))
+    try:
+        while True:
+            job = min(schedule, key=lambda j: j.next_run)
+            wait = (job.next_run - datetime.now()).total_seconds()
+            if wait > 0:
+                logging.info(f"Next: {job.mail_subject} at {job.next_run:%Y-%m-%d %H:%M:%S}")
+                while wait > 0:
+                    # short naps, so that clock changes and suspend do not shift the schedule
+                    sleep_(min(wait, 60.0))
+                    wait = (job.next_run - datetime.now()).total_seconds()
+            _reset_run()
+            if not _FILE_HANDLER:
+                _attach_file_handler()
+            # mails spooled by earlier job runs are not left until the daemon stops
+            _start_outbox_flush()
+            logging.info(f"Job {job}")
+            interrupted = _run_job(job.callback, job.mail_subject, datetime.now(), perf_counter(), process_time(),
+                                   per_run=True)
+            job.schedule_next(datetime.now())
+            if interrupted:
+                break
+    except KeyboardInterrupt:
+        logging.info("Daemon stopped")
+    finally:
+        _close_pool()
+        _finish_outbox_flush()
+    logging.info("Ciao.")
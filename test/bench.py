@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmarks for johanna's hot paths. Needs no network, works in a temporary
+folder and writes the results as JSON (all values in seconds, lower is better).
+
+Usage:
+    bench.py [--out=<json>] [--baseline=<json>] [--threshold=<factor>] [--tail-mb=<mb>] [--quick]
+    bench.py -h | --help
+
+Options:
+    --out=<json>          Write results to this file [default: bench.json].
+    --baseline=<json>     Compare with the results of an earlier run.
+    --threshold=<factor>  Fail if a value is that much worse than the baseline [default: 1.25].
+    --tail-mb=<mb>        Size of the log file for the _tail benchmark [default: 200].
+    --quick               Fewer repetitions and smaller data, for a smoke test.
+    -h --help             Show this screen.
+
+Exits with 1 if a value regressed beyond the threshold.
+
+Created: 16.10.26
+"""
+
+import os
+import sys
+import json
+import logging
+import platform
+import subprocess
+import tempfile
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+from docopt import docopt
+
+PACKAGE_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PACKAGE_ROOT))
+
+import johanna
+from johanna import private
+
+from startup import measure as measure_import
+
+REPEAT = 5
+
+
+def timed(fn, repeat: int = None) -> float:
+    """
+    :return: median seconds of fn() over repeat runs
+    """
+    times = []
+    for _ in range(repeat or REPEAT):
+        t0 = perf_counter()
+        fn()
+        times.append(perf_counter() - t0)
+    return median(times)
+
+
+def bench_connection(n: int) -> dict:
+    def open_close(pooled):
+        def run():
+            for _ in range(n):
+                with johanna.Connection(quiet=True, pooled=pooled) as c:
+                    c.cur.execute("SELECT 1").fetchone()
+        return run
+    private._close_pool()
+    return {
+        "connection.open_close": timed(open_close(False)) / n,
+        "connection.open_close_pooled": timed(open_close(True)) / n,
+    }
+
+
+def bench_insert(folder: Path, n: int) -> dict:
+    results = {}
+    settings = {
+        "delete_full": {"journal_mode": "DELETE", "synchronous": "FULL"},
+        "wal_normal": {"journal_mode": "WAL", "synchronous": "NORMAL"},
+        "wal_off": {"journal_mode": "WAL", "synchronous": "OFF"},
+    }
+    for label, pragmas in settings.items():
+        dbpath = folder / f"insert_{label}.sqlite"
+        for pragma, value in pragmas.items():
+            private._CONFIG["databases"][f"{dbpath.name}.{pragma}"] = value
+        with johanna.Connection(dbpath=dbpath, quiet=True, readonly=False) as c:
+            c.cur.execute("CREATE TABLE IF NOT EXISTS t (k INTEGER PRIMARY KEY, v TEXT)")
+            c.commit()
+
+            def per_row():
+                c.cur.execute("DELETE FROM t")
+                c.commit()
+                for i in range(n // 50):
+                    c.cur.execute("INSERT INTO t VALUES (?, ?)", (i, "value"))
+                    c.commit()
+
+            def bulk():
+                c.cur.execute("DELETE FROM t")
+                c.commit()
+                c.bulk_insert("t", ((i, "value") for i in range(n)))
+
+            results[f"insert.{label}.commit_per_row"] = timed(per_row, 3) / (n // 50)
+            results[f"insert.{label}.bulk"] = timed(bulk, 3) / n
+    return results
+
+
+def bench_schema(folder: Path) -> dict:
+    schema = folder / "schema.sql"
+    schema.write_text("".join(f"CREATE TABLE IF NOT EXISTS t{i} (k TEXT PRIMARY KEY, v TEXT);\n"
+                              f"CREATE INDEX IF NOT EXISTS t{i}_v ON t{i}(v);\n" for i in range(50)))
+    johanna.apply_schema(schema)
+    return {"apply_schema.unchanged": timed(lambda: johanna.apply_schema(schema), 20)}
+
+
+LOGGING_PROBE = """
+import sys, logging, time
+sys.path.insert(0, {root!r})
+from johanna import private
+private._DOTFOLDER = private.Path({folder!r})
+private._init_logging(collective={collective}, console={console}, process={process}, queued={queued})
+t0 = time.perf_counter()
+for i in range({n}):
+    logging.info("line %d of the benchmark with some payload to make it realistic", i)
+private._flush_logging()
+print(time.perf_counter() - t0, file=sys.stderr)
+"""
+
+
+def bench_logging(folder: Path, n: int) -> dict:
+    results = {}
+    combinations = {
+        "console": (False, True, False),
+        "process": (False, False, True),
+        "collective+console+process": (True, True, True),
+    }
+    for label, (collective, console, process) in combinations.items():
+        for queued in (False, True):
+            times = []
+            for _ in range(3):
+                logfolder = Path(tempfile.mkdtemp(dir=folder))
+                probe = LOGGING_PROBE.format(root=str(PACKAGE_ROOT), folder=str(logfolder), collective=collective,
+                                             console=console, process=process, queued=queued, n=n)
+                out = subprocess.run([sys.executable, "-c", probe], stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.PIPE, text=True, check=True)
+                times.append(float(out.stderr.strip().splitlines()[-1]))
+            results[f"logging.{label}{'.queued' if queued else ''}"] = median(times) / n
+    return results
+
+
+def bench_tail(folder: Path, mb: int) -> dict:
+    log = folder / "big.log"
+    line = "2026-10-16 20:00:00,000 [INFO] Ölmühle Döbeln: Messwert übernommen, alles im grünen Bereich\n"
+    block = line.encode() * 10_000
+    with open(log, "wb") as fh:
+        for _ in range(max(1, mb * 1024 * 1024 // len(block))):
+            fh.write(block)
+    results = {
+        "tail.bytes": timed(lambda: private._tail(log), 20),
+        "tail.lines": timed(lambda: private._tail(log, lines=200), 20),
+        "excerpt": timed(lambda: private._excerpt(log), 1),
+    }
+    log.unlink()
+    return results
+
+
+MAIN_PROBE = """
+import sys, os
+sys.path.insert(0, {root!r})
+import johanna
+johanna.main(lambda: None, dotfolder={folder!r}, mail_subject="bench")
+"""
+
+
+def bench_startup(folder: Path) -> dict:
+    import_ms, _ = measure_import()
+    dotfolder = folder / "startup"
+
+    def run():
+        subprocess.run([sys.executable, "-c", MAIN_PROBE.format(root=str(PACKAGE_ROOT), folder=str(dotfolder))],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    run()  # first run creates the folder, the .ini and the history
+    return {
+        "startup.import": import_ms / 1000,
+        "startup.main": timed(run),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    :return: descriptions of the values that regressed
+    """
+    regressions = []
+    for name, value in sorted(results.items()):
+        before = baseline.get(name)
+        if before and value > threshold * before:
+            regressions.append(f"{name}: {value:.6g} s vs. {before:.6g} s ({value / before:.2f}x)")
+    return regressions
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    quick = args["--quick"]
+    if quick:
+        REPEAT = 2
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        os.environ["JOHANNA"] = str(folder)
+        johanna.interactive(dotfolder=folder, dbname="bench.sqlite", readonly=False)
+        logging.getLogger().setLevel(logging.WARNING)
+
+        results = {}
+        results.update(bench_connection(200 if quick else 2000))
+        results.update(bench_insert(folder, 5_000 if quick else 100_000))
+        results.update(bench_schema(folder))
+        results.update(bench_logging(folder, 2_000 if quick else 50_000))
+        results.update(bench_tail(folder, 5 if quick else int(args["--tail-mb"])))
+        results.update(bench_startup(folder))
+
+    for name, value in sorted(results.items()):
+        print(f"{name:<45} {value:12.6g} s")
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    Path(args["--out"]).write_text(json.dumps(report, indent=2))
+
+    if args["--baseline"]:
+        baseline = json.loads(Path(args["--baseline"]).read_text())["results"]
+        regressions = compare(results, baseline, float(args["--threshold"]))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
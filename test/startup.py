@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Keeps "import johanna" cheap. Measures the import in fresh interpreters and
+checks that no heavy module is imported on the way.
+
+Usage:
+    python startup.py [<max_ms>]
+
+Exits with 1 if the median import takes longer than max_ms (default 50) or a
+heavy module shows up.
+
+Created: 16.10.26
+"""
+
+import sys
+import subprocess
+from pathlib import Path
+from statistics import median
+
+# must only be imported when johanna actually needs them
+HEAVY = ["requests", "docopt", "asyncio", "inspect", "multiprocessing", "tracemalloc",
+         "configparser", "logging.handlers", "concurrent.futures", "statistics", "gzip"]
+
+PROBE = """
+import sys, time
+t0 = time.perf_counter()
+import johanna
+dt = time.perf_counter() - t0
+print(dt * 1000)
+print(" ".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def measure(runs: int = 11) -> tuple:
+    package_root = Path(__file__).resolve().parent.parent
+    times = []
+    loaded = set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", PROBE.format(heavy=HEAVY)], cwd=package_root,
+                             capture_output=True, text=True, check=True).stdout.splitlines()
+        times.append(float(out[0]))
+        loaded.update(out[1].split() if len(out) > 1 else [])
+    return median(times), sorted(loaded)
+
+
+if __name__ == "__main__":
+    max_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 50.0
+    ms, loaded = measure()
+    print(f"import johanna: {ms:.1f} ms (median, limit {max_ms:.0f} ms)")
+    if loaded:
+        print(f"heavy modules imported: {', '.join(loaded)}")
+    sys.exit(1 if ms > max_ms or loaded else 0)